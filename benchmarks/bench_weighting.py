@@ -0,0 +1,142 @@
+"""
+Benchmarks for the weighting and comparing modules.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_weighting --sizes 10000 100000 1000000 --output bench_results
+
+Every run appends to <output>/weighting.csv and writes <output>/weighting_<timestamp>.json,
+so results of different commits can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+import pandas as pd
+
+from benchmarks.synthetic import make_survey
+from modules.processing import comparing, weighting
+
+
+def _rake(sample_df, census_df, strata):
+    _, trace = weighting.rake_weights_weighted(sample_df, census_df, strata, "Count", return_trace=True)
+    return len(trace)
+
+
+def _poststratify(sample_df, census_df, strata):
+    weighting.poststratify_weights_weighted(sample_df, census_df, strata, "Count")
+    return None
+
+
+def _apply_weights(sample_df, census_df, strata):
+    _, trace = weighting.apply_weights(sample_df, census_df, strata, method="rake", weight_col="Count", return_trace=True)
+    return len(trace)
+
+
+def _compare(sample_df, census_df, strata):
+    comparing.compare_distributions(sample_df, census_df, strata, weight_col_b="Count")
+    return None
+
+
+BENCHMARKS = {
+    "rake_weights": _rake,
+    "poststratify_weights": _poststratify,
+    "apply_weights": _apply_weights,
+    "compare_distributions": _compare,
+}
+
+
+def measure(func, *args, repeat: int = 1) -> dict:
+    """
+    Runs func repeat times and reports the best wall time, the peak traced
+    memory of the best run and, under "result", whatever func returns.
+    """
+    best = None
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            result = func(*args)
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if best is None or wall < best["wall_s"]:
+            best = {"wall_s": wall, "peak_mb": peak / 2 ** 20, "result": result}
+    return best
+
+
+def run(sizes: list, n_strata: int, cardinality: int, skew: float, empty_rate: float, benchmarks: list, repeat: int, seed: int) -> pd.DataFrame:
+    """
+    Runs the selected benchmarks for every sample size.
+
+    Returns:
+    - DataFrame with one row per (benchmark, size)
+    """
+    rows = []
+    for n_rows in sizes:
+        sample_df, census_df = make_survey(n_rows, n_strata, cardinality, skew, empty_rate, seed=seed)
+        strata = [f"strat_{i}" for i in range(n_strata)]
+        for name in benchmarks:
+            result = measure(BENCHMARKS[name], sample_df.copy(), census_df, strata, repeat=repeat)
+            result["iterations"] = result.pop("result")
+            rows.append({
+                "benchmark": name, "n_rows": n_rows, "n_strata": n_strata, "cardinality": cardinality,
+                "skew": skew, "empty_rate": empty_rate, **result
+            })
+            print(f"{name:<24} n={n_rows:>10,}  {result['wall_s']:9.3f}s  {result['peak_mb']:9.1f} MB  iterations={result['iterations']}")
+    return pd.DataFrame(rows)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save(results: pd.DataFrame, output: str, name: str) -> None:
+    """
+    Appends results to <output>/<name>.csv and writes a JSON file with run metadata.
+    """
+    os.makedirs(output, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results = results.assign(commit=_git_commit(), timestamp=stamp)
+
+    csv_path = os.path.join(output, f"{name}.csv")
+    results.to_csv(csv_path, mode="a", header=not os.path.exists(csv_path), index=False)
+    with open(os.path.join(output, f"{name}_{stamp}.json"), "w") as f:
+        json.dump({
+            "commit": results["commit"].iloc[0] if len(results) else _git_commit(),
+            "timestamp": stamp,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "results": results.to_dict(orient="records"),
+        }, f, indent=2, default=str)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the weighting and comparing modules.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--strata", type=int, default=4)
+    parser.add_argument("--cardinality", type=int, default=5)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--empty-rate", type=float, default=0.0)
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.strata, args.cardinality, args.skew, args.empty_rate, args.benchmarks, args.repeat, args.seed)
+    save(results, args.output, "weighting")
+
+
+if __name__ == "__main__":
+    main()
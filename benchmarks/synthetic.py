@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+def make_survey(
+    n_rows: int,
+    n_strata: int = 4,
+    cardinality=5,
+    skew: float = 1.0,
+    empty_rate: float = 0.0,
+    n_census: int = None,
+    seed: int = 0
+) -> tuple:
+    """
+    Generates a synthetic survey sample and a matching aggregated census table.
+
+    Sample categories follow a power law p_k ~ (k + 1) ** -skew, while the census
+    is close to uniform, so weighting has real work to do.
+
+    Parameters:
+    - n_rows: Number of sample rows
+    - n_strata: Number of stratification variables (columns 'strat_0', 'strat_1', ...)
+    - cardinality: Categories per stratum, an int or one int per stratum
+    - skew: Power-law exponent of the sample category distribution (0 = uniform)
+    - empty_rate: Share of categories per stratum that never occur in the sample,
+      which produces empty cells and missing categories
+    - n_census: Number of census rows to aggregate (defaults to n_rows)
+    - seed: Seed for reproducibility
+
+    Returns:
+    - Tuple (sample_df, census_df): census_df has one row per occupied cell and a 'Count' column
+    """
+    rng = np.random.default_rng(seed)
+    cardinalities = [cardinality] * n_strata if np.isscalar(cardinality) else list(cardinality)
+    n_census = n_rows if n_census is None else n_census
+
+    sample, census = {}, {}
+    for i, k in enumerate(cardinalities):
+        categories = np.array([f"c{j}" for j in range(k)], dtype=object)
+
+        sample_p = (np.arange(k) + 1.0) ** -skew
+        n_empty = min(int(round(empty_rate * k)), k - 1)
+        sample_p[rng.choice(k, n_empty, replace=False)] = 0.0
+        sample_p /= sample_p.sum()
+
+        census_p = rng.dirichlet(np.full(k, 50.0))
+
+        sample[f"strat_{i}"] = pd.Categorical.from_codes(rng.choice(k, n_rows, p=sample_p), categories).astype(object)
+        census[f"strat_{i}"] = rng.choice(k, n_census, p=census_p)
+
+    sample_df = pd.DataFrame(sample)
+    sample_df["value"] = rng.normal(size=n_rows)
+
+    strata = list(census)
+    census_df = pd.DataFrame(census).groupby(strata).size().rename("Count").reset_index()
+    for i, col in enumerate(strata):
+        census_df[col] = np.array([f"c{j}" for j in range(cardinalities[i])], dtype=object)[census_df[col]]
+    return sample_df, census_df
+
+
+def make_outlier_block(n_rows: int, n_cols: int = 10, outlier_rate: float = 0.01, seed: int = 0) -> tuple:
+    """
+    Generates a correlated Gaussian numeric block with planted multivariate outliers.
+
+    Half of the outliers are shifted along the direction of least variance, so
+    they break the correlation structure without being extreme in any single
+    column; the other half are shifted along a random direction.
+
+    Parameters:
+    - n_rows: Number of rows
+    - n_cols: Number of numeric columns ('x_0', 'x_1', ...)
+    - outlier_rate: Share of planted outliers
+    - seed: Seed for reproducibility
+
+    Returns:
+    - Tuple (df, is_outlier): is_outlier is a boolean array marking the planted rows
+    """
+    rng = np.random.default_rng(seed)
+    mixing = rng.normal(size=(n_cols, n_cols)) / np.sqrt(n_cols)
+    values = rng.normal(size=(n_rows, n_cols)) @ mixing
+    covariance = mixing.T @ mixing
+
+    is_outlier = np.zeros(n_rows, dtype=bool)
+    rows = rng.choice(n_rows, int(round(outlier_rate * n_rows)), replace=False)
+    is_outlier[rows] = True
+    eigvals, eigvecs = np.linalg.eigh(covariance)
+    subtle, gross = rows[:len(rows) // 2], rows[len(rows) // 2:]
+    values[subtle] += 6 * np.sqrt(eigvals[0]) * eigvecs[:, 0] * rng.choice([-1, 1], (len(subtle), 1))
+    random_dirs = rng.normal(size=(len(gross), n_cols))
+    random_dirs /= np.linalg.norm(random_dirs, axis=1, keepdims=True)
+    values[gross] += 6 * np.sqrt(eigvals[-1]) * random_dirs
+
+    df = pd.DataFrame(values, columns=[f"x_{i}" for i in range(n_cols)])
+    return df, is_outlier
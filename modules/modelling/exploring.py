@@ -1,28 +1,35 @@
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+from modules.processing.missingness import MissingnessIndex
 
-def data_overview(df):
+def data_overview(df, missing_index=None):
     """
     Prints basic information about the DataFrame including shape, data types,
     missing values, and descriptive statistics.
     
     Parameters:
     - df (pd.DataFrame): The input DataFrame.
+    - missing_index (MissingnessIndex, optional): Index of df to take the missing value counts from.
     """
+    missing = missing_index.null_counts() if missing_index is not None else df.isnull().sum()
     print("Shape:", df.shape)
     print("\nData Types:\n", df.dtypes)
-    print("\nMissing Values:\n", df.isnull().sum())
+    print("\nMissing Values:\n", missing)
     print("\nDescriptive Statistics:\n", df.describe(include='all'))
 
-def plot_missing_values(df):
+def plot_missing_values(df, missing_index=None):
     """
     Displays a heatmap indicating the location of missing values in the DataFrame.
     
     Parameters:
     - df (pd.DataFrame): The input DataFrame.
+    - missing_index (MissingnessIndex, optional): Index of df to take the null masks from.
     """
-    sns.heatmap(df.isnull(), cbar=False, cmap='viridis')
+    if missing_index is None:
+        missing_index = MissingnessIndex(df)
+    missing = pd.DataFrame(missing_index.matrix(list(df.columns)), index=df.index, columns=df.columns)
+    sns.heatmap(missing, cbar=False, cmap='viridis')
     plt.title("Missing Values Heatmap")
     plt.show()
 
@@ -1,7 +1,11 @@
 import pandas as pd
 import numpy as np
 import warnings
+import io
+from collections import OrderedDict
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from modules.processing.execution import fingerprint
 
 def compare_distributions(
     df_a: pd.DataFrame,
@@ -9,7 +13,8 @@ def compare_distributions(
     strata: list,
     weight_col_a: str = None,
     weight_col_b: str = None,
-    normalize: bool = True
+    normalize: bool = True,
+    return_metrics: bool = False
 ) -> pd.DataFrame:
     """
     Compares the marginal distributions of given features between two DataFrames.
@@ -21,12 +26,41 @@ def compare_distributions(
     - weight_col_a: Optional, weight column for df_a
     - weight_col_b: Optional, weight column for df_b
     - normalize: If True, show proportions (else raw counts)
+    - return_metrics: If True, also return per-variable distance metrics
 
     Returns:
     - A DataFrame with the distributions from both DataFrames and their absolute differences.
+      If return_metrics is True, a tuple (comparison, metrics) is returned instead, where
+      metrics has one row per variable with TVD, Hellinger, KL and Chi2 (see distribution_metrics).
+    """
+    counts = _count_matrix(df_a, df_b, strata, weight_col_a, weight_col_b)
+    comparison = _comparison_table(counts, normalize)
+    if return_metrics:
+        return comparison, _distribution_metrics(counts)
+    return comparison
+
+
+def _count_matrix(
+    df_a: pd.DataFrame,
+    df_b: pd.DataFrame,
+    strata: list,
+    weight_col_a: str = None,
+    weight_col_b: str = None
+) -> dict:
     """
-    results = []
+    Weighted category counts of all strata for both DataFrames.
 
+    Each variable is factorized once over both frames against a shared, sorted
+    category dictionary (the only per-variable step, since every variable has its
+    own categories and dtype). The codes are offset into one global category space
+    and counted with a single np.bincount per frame, so the counts of all
+    variables live in one (2, n_categories) matrix.
+
+    Returns:
+    - dict with 'variables', 'offsets' (segment start per variable plus the end),
+      'categories' (object array) and 'counts' (2 x n_categories array for A and B)
+    """
+    variables = []
     for var in strata:
         if var not in df_a.columns:
             warnings.warn(f"Strata variable '{var}' not found in df_a. Skipping.")
@@ -34,36 +68,217 @@ def compare_distributions(
         if var not in df_b.columns:
             warnings.warn(f"Strata variable '{var}' not found in df_b. Skipping.")
             continue
+        variables.append(var)
+
+    weights_a = df_a[weight_col_a].to_numpy(dtype=float) if weight_col_a else None
+    weights_b = df_b[weight_col_b].to_numpy(dtype=float) if weight_col_b else None
+
+    codes, categories, sizes = [], [], []
+    for var in variables:
+        codes_a, categories_a = pd.factorize(df_a[var])
+        codes_b, categories_b = pd.factorize(df_b[var])
+        var_categories = categories_a.append(categories_b).unique().sort_values()
+        # Remap both code sets onto the shared sorted dictionary (-1 stays missing)
+        lookup_a = np.append(var_categories.get_indexer(categories_a), -1)
+        lookup_b = np.append(var_categories.get_indexer(categories_b), -1)
+        codes.append((lookup_a[codes_a], lookup_b[codes_b]))
+        categories.append(np.asarray(var_categories, dtype=object))
+        sizes.append(len(var_categories))
+
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.intp)
+    counts = np.zeros((2, offsets[-1]))
+    for row, weights in enumerate((weights_a, weights_b) if codes else ()):
+        # Shift every variable's codes into its segment and count all of them at once;
+        # missing values (code -1) are dropped, like value_counts and groupby
+        parts = [part[row] for part in codes]
+        global_codes = np.concatenate([part + offset for part, offset in zip(parts, offsets[:-1])])
+        observed = np.concatenate([part >= 0 for part in parts])
+        if weights is not None:
+            weights = np.tile(weights, len(parts))[observed]
+        counts[row] = np.bincount(global_codes[observed], weights=weights, minlength=offsets[-1])
+
+    return {
+        "variables": variables,
+        "offsets": offsets,
+        "categories": np.concatenate(categories) if categories else np.zeros(0, dtype=object),
+        "counts": counts,
+    }
+
+
+def _segment_sums(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Sums values over the category segment of every variable (last axis).
+    """
+    segments = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    if values.ndim == 1:
+        return np.bincount(segments, weights=values, minlength=len(offsets) - 1)
+    return np.stack([_segment_sums(row, offsets) for row in values])
+
+
+def _proportions(counts: dict) -> np.ndarray:
+    """
+    Per-variable proportions of the count matrix.
+    """
+    offsets = counts["offsets"]
+    totals = _segment_sums(counts["counts"], offsets)
+    totals = np.repeat(totals, np.diff(offsets), axis=-1)
+    return np.divide(counts["counts"], totals, out=np.zeros_like(counts["counts"]), where=totals > 0)
+
+
+def _comparison_table(counts: dict, normalize: bool) -> pd.DataFrame:
+    """
+    Long comparison table (one row per variable and category) from the count matrix.
+    """
+    dist = _proportions(counts) if normalize else counts["counts"]
+    comparison = pd.DataFrame({
+        "Variable": np.repeat(np.asarray(counts["variables"], dtype=object), np.diff(counts["offsets"])),
+        "Category": counts["categories"],
+        "Dist_A": dist[0],
+        "Dist_B": dist[1]
+    })
+    comparison["Abs_Diff"] = (comparison["Dist_A"] - comparison["Dist_B"]).abs()
+    return comparison
+
+
+def _distribution_metrics(counts: dict) -> pd.DataFrame:
+    """
+    Per-variable distance metrics between the distributions of A and B.
+
+    - TVD: total variation distance, 0.5 * sum |p - q|
+    - Hellinger: sqrt(0.5 * sum (sqrt(p) - sqrt(q))^2)
+    - KL: Kullback-Leibler divergence KL(A || B), inf if A has mass where B has none
+    - Chi2: Pearson chi-square of the (weighted) counts of A against the proportions of B
+    - Df: Degrees of freedom for Chi2 (categories of B with mass, minus one)
+    """
+    offsets = counts["offsets"]
+    p, q = _proportions(counts)
+    total_a = _segment_sums(counts["counts"][0], offsets)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kl_terms = np.where(p > 0, p * np.log(p / q), 0.0)
+        chi2_terms = np.where(q > 0, (p - q) ** 2 / q, np.where(p > 0, np.inf, 0.0))
+
+    return pd.DataFrame({
+        "Variable": counts["variables"],
+        "TVD": 0.5 * _segment_sums(np.abs(p - q), offsets),
+        "Hellinger": np.sqrt(0.5 * _segment_sums((np.sqrt(p) - np.sqrt(q)) ** 2, offsets)),
+        "KL": _segment_sums(kl_terms, offsets),
+        "Chi2": total_a * _segment_sums(chi2_terms, offsets),
+        "Df": np.maximum(_segment_sums((q > 0).astype(float), offsets) - 1, 0).astype(int)
+    })
+
+
+class IncrementalComparison:
+    """
+    Keeps weighted category counters per variable so that distributions of a
+    growing sample (A) can be compared against a fixed target (B) without
+    rescanning the accumulated sample. Each update costs O(chunk).
 
-        if weight_col_a:
-            dist_a = df_a.groupby(var)[weight_col_a].sum()
-        else:
-            dist_a = df_a[var].value_counts()
+    A full recompute (reset and feeding all chunks again) is only needed when
+    the weights of already absorbed rows change.
+    """
+
+    def __init__(self, target_df: pd.DataFrame, strata: list, weight_col_target: str = None, weight_col: str = None):
+        """
+        Parameters:
+        - target_df: Target DataFrame (B), counted once
+        - strata: List of columns to compare
+        - weight_col_target: Optional, weight column for target_df
+        - weight_col: Optional, weight column of the sample chunks
+        """
+        self.strata = [var for var in strata if var in target_df.columns]
+        for var in set(strata) - set(self.strata):
+            warnings.warn(f"Strata variable '{var}' not found in target_df. Skipping.")
+        self.weight_col = weight_col
+        self.n_rows = 0
+
+        weights = target_df[weight_col_target].to_numpy(dtype=float) if weight_col_target else None
+        self._categories = {}
+        self._counts_b = {}
+        self._counts_a = {}
+        for var in self.strata:
+            self._categories[var] = pd.Index([])
+            self._counts_b[var] = np.zeros(0)
+            self._counts_a[var] = np.zeros(0)
+            self._counts_b[var] = self._accumulate(var, target_df[var], weights, self._counts_b[var])
+
+    def update(self, chunk: pd.DataFrame) -> "IncrementalComparison":
+        """
+        Absorbs a new batch of sample rows.
+
+        Parameters:
+        - chunk: DataFrame with the strata (and weight) columns
 
-        if weight_col_b:
-            dist_b = df_b.groupby(var)[weight_col_b].sum()
-        else:
-            dist_b = df_b[var].value_counts()
+        Returns:
+        - self, so calls can be chained
+        """
+        weights = chunk[self.weight_col].to_numpy(dtype=float) if self.weight_col else None
+        for var in self.strata:
+            if var not in chunk.columns:
+                warnings.warn(f"Strata variable '{var}' not found in chunk. Skipping.")
+                continue
+            self._counts_a[var] = self._accumulate(var, chunk[var], weights, self._counts_a[var])
+        self.n_rows += len(chunk)
+        return self
 
-        if normalize:
-            dist_a = dist_a / dist_a.sum()
-            dist_b = dist_b / dist_b.sum()
+    def reset(self) -> None:
+        """
+        Clears the sample counters, keeping the target counts.
+        """
+        for var in self.strata:
+            self._counts_a[var] = np.zeros(len(self._categories[var]))
+        self.n_rows = 0
 
-        all_cats = sorted(set(dist_a.index).union(set(dist_b.index)))
-        dist_a = dist_a.reindex(all_cats, fill_value=0)
-        dist_b = dist_b.reindex(all_cats, fill_value=0)
+    def comparison(self, normalize: bool = True) -> pd.DataFrame:
+        """
+        Current comparison table, in the format of compare_distributions.
+        """
+        return _comparison_table(self._count_matrix(), normalize)
 
-        merged = pd.DataFrame({
-            "Variable": var,
-            "Category": all_cats,
-            "Dist_A": dist_a.values,
-            "Dist_B": dist_b.values
-        })
-        merged["Abs_Diff"] = (merged["Dist_A"] - merged["Dist_B"]).abs()
+    def metrics(self) -> pd.DataFrame:
+        """
+        Current per-variable drift metrics (TVD, Hellinger, KL, Chi2) against the target.
+        """
+        return _distribution_metrics(self._count_matrix())
 
-        results.append(merged)
+    def _accumulate(self, var: str, values: pd.Series, weights: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """
+        Adds the weighted category counts of values to counts, growing the
+        category dictionary of var (and both counters) for unseen categories.
+        """
+        codes, chunk_categories = pd.factorize(values)
+        categories = self._categories[var]
+        lookup = categories.get_indexer(chunk_categories)
+        if (lookup < 0).any():
+            categories = categories.append(chunk_categories[lookup < 0])
+            self._categories[var] = categories
+            lookup = categories.get_indexer(chunk_categories)
+            for counter in (self._counts_a, self._counts_b):
+                counter[var] = np.pad(counter[var], (0, len(categories) - len(counter[var])))
+            counts = np.pad(counts, (0, len(categories) - len(counts)))
 
-    return pd.concat(results, ignore_index=True)
+        observed = codes >= 0
+        return counts + np.bincount(
+            lookup[codes[observed]], weights=None if weights is None else weights[observed], minlength=len(categories)
+        )
+
+    def _count_matrix(self) -> dict:
+        """
+        Snapshot of the counters in the format of _count_matrix (categories sorted).
+        """
+        categories, counts, sizes = [], [], []
+        for var in self.strata:
+            var_categories, order = self._categories[var].sort_values(return_indexer=True)
+            categories.append(np.asarray(var_categories, dtype=object))
+            counts.append(np.vstack([self._counts_a[var][order], self._counts_b[var][order]]))
+            sizes.append(len(var_categories))
+
+        return {
+            "variables": list(self.strata),
+            "offsets": np.concatenate([[0], np.cumsum(sizes)]).astype(np.intp),
+            "categories": np.concatenate(categories) if categories else np.zeros(0, dtype=object),
+            "counts": np.hstack(counts) if counts else np.zeros((2, 0)),
+        }
 
 
 def plot_distribution_comparison(
@@ -73,53 +288,112 @@ def plot_distribution_comparison(
     weight_col_a: str = None,
     weight_col_b: str = None,
     normalize: bool = True,
-    figsize: tuple = (6, 4)
+    figsize: tuple = (6, 4),
+    comparison: pd.DataFrame = None,
+    per_page: int = 12,
+    ncols: int = 3
 ):
     """
     Plots the marginal distributions of given features for two DataFrames.
 
+    All variables are drawn as small multiples into grid figures of up to
+    per_page subplots each.
+
     Parameters:
     - df_a, df_b: DataFrames to compare
     - strata: List of columns to compare
     - weight_col_a, weight_col_b: Optional weighting columns for df_a and df_b
     - normalize: Show proportions (default) or raw counts
     - figsize: Size of each subplot
+    - comparison: Optional, result of compare_distributions to plot instead of recomputing it
+    - per_page: Max number of variables per figure
+    - ncols: Number of subplot columns
     """
-    for var in strata:
-        if var not in df_a.columns:
-            warnings.warn(f"Strata variable '{var}' not found in df_a. Skipping plot.")
-            continue
-        if var not in df_b.columns:
-            warnings.warn(f"Strata variable '{var}' not found in df_b. Skipping plot.")
-            continue
+    if comparison is None:
+        comparison = compare_distributions(df_a, df_b, strata, weight_col_a, weight_col_b, normalize)
 
-        if weight_col_a:
-            dist_a = df_a.groupby(var)[weight_col_a].sum()
-        else:
-            dist_a = df_a[var].value_counts()
-
-        if weight_col_b:
-            dist_b = df_b.groupby(var)[weight_col_b].sum()
-        else:
-            dist_b = df_b[var].value_counts()
-
-        if normalize:
-            dist_a = dist_a / dist_a.sum()
-            dist_b = dist_b / dist_b.sum()
-
-        all_cats = sorted(set(dist_a.index).union(set(dist_b.index)))
-        dist_a = dist_a.reindex(all_cats, fill_value=0)
-        dist_b = dist_b.reindex(all_cats, fill_value=0)
-
-        x = np.arange(len(all_cats))
-        width = 0.35
-
-        plt.figure(figsize=figsize)
-        plt.bar(x - width / 2, dist_a, width, label='A')
-        plt.bar(x + width / 2, dist_b, width, label='B')
-        plt.xticks(ticks=x, labels=all_cats, rotation=45)
-        plt.ylabel('Proportion' if normalize else 'Count')
-        plt.title(f"Distribution of '{var}' in A vs. B")
-        plt.legend()
-        plt.tight_layout()
+    for page in range(comparison_page_count(comparison, per_page)):
+        fig = plt.figure()
+        _draw_comparison_grid(fig, comparison, normalize, page, per_page, ncols, figsize)
         plt.show()
+
+
+def render_distribution_comparison(
+    comparison: pd.DataFrame,
+    normalize: bool = True,
+    page: int = 0,
+    per_page: int = 12,
+    ncols: int = 3,
+    figsize: tuple = (6, 4),
+    fmt: str = "png",
+    dpi: int = 100
+) -> bytes:
+    """
+    Renders one page of the small-multiples comparison grid to image bytes.
+
+    Rendered pages are cached by a fingerprint of the comparison table and the
+    parameters, so Streamlit reruns with unchanged inputs don't redraw anything.
+
+    Parameters:
+    - comparison: Result of compare_distributions
+    - normalize: Whether the comparison holds proportions (only affects the axis label)
+    - page: Page to render (0-based), see comparison_page_count
+    - per_page: Max number of variables per page
+    - ncols: Number of subplot columns
+    - figsize: Size of each subplot
+    - fmt: Image format, e.g. 'png' or 'svg'
+    - dpi: Resolution for raster formats
+
+    Returns:
+    - The rendered image as bytes
+    """
+    key = fingerprint(comparison, (normalize, page, per_page, ncols, tuple(figsize), fmt, dpi))
+    if key in _RENDER_CACHE:
+        _RENDER_CACHE.move_to_end(key)
+        return _RENDER_CACHE[key]
+
+    fig = Figure()
+    _draw_comparison_grid(fig, comparison, normalize, page, per_page, ncols, figsize)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi)
+
+    _RENDER_CACHE[key] = buffer.getvalue()
+    if len(_RENDER_CACHE) > _RENDER_CACHE_SIZE:
+        _RENDER_CACHE.popitem(last=False)
+    return _RENDER_CACHE[key]
+
+
+def comparison_page_count(comparison: pd.DataFrame, per_page: int = 12) -> int:
+    """
+    Number of pages needed to plot every variable of a comparison table.
+    """
+    return -(-comparison["Variable"].nunique() // per_page)
+
+
+_RENDER_CACHE = OrderedDict()
+_RENDER_CACHE_SIZE = 64
+
+
+def _draw_comparison_grid(fig, comparison: pd.DataFrame, normalize: bool, page: int, per_page: int, ncols: int, figsize: tuple) -> None:
+    """
+    Draws one page of grouped bar charts (A vs. B, one subplot per variable) onto fig.
+    """
+    variables = comparison["Variable"].unique()[page * per_page:(page + 1) * per_page]
+    nrows = max(-(-len(variables) // ncols), 1)
+    fig.set_size_inches(figsize[0] * ncols, figsize[1] * nrows)
+    axes = fig.subplots(nrows, ncols, squeeze=False).ravel()
+    groups = comparison[comparison["Variable"].isin(variables)].groupby("Variable", sort=False)
+
+    width = 0.35
+    for ax, (var, dist) in zip(axes, groups):
+        x = np.arange(len(dist))
+        ax.bar(x - width / 2, dist["Dist_A"], width, label='A')
+        ax.bar(x + width / 2, dist["Dist_B"], width, label='B')
+        ax.set_xticks(x)
+        ax.set_xticklabels(dist["Category"].astype(str), rotation=45)
+        ax.set_ylabel('Proportion' if normalize else 'Count')
+        ax.set_title(f"Distribution of '{var}' in A vs. B")
+        ax.legend()
+    for ax in axes[len(variables):]:
+        ax.set_visible(False)
+    fig.tight_layout()
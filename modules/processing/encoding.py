@@ -1,6 +1,9 @@
 import pandas as pd
+import numpy as np
+from scipy import sparse
+from modules.processing.execution import prepare_output
 
-def ordinal_to_numeric(df: pd.DataFrame, ordinal_columns: list, column_mapping: dict) -> pd.DataFrame:
+def ordinal_to_numeric(df: pd.DataFrame, ordinal_columns: list, column_mapping: dict, inplace: bool = False) -> pd.DataFrame:
     """
     Preprocess ordinal data by mapping ordinal columns to numerical values.
 
@@ -11,39 +14,374 @@ def ordinal_to_numeric(df: pd.DataFrame, ordinal_columns: list, column_mapping:
         List of columns that contain ordinal data.
     - column_mapping: dict
         Mapping of ordinal categories to numerical values.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
     - df: pd.DataFrame
         A DataFrame with ordinal columns converted to numerical values.
     """
+    out = prepare_output(df, inplace)
     for col in ordinal_columns:
         if col in column_mapping:
-            df[col] = df[col].map(column_mapping[col])
-    return df
+            out[col] = df[col].map(column_mapping[col])
+    return out
 
 
-def nominal_to_one_hot(df: pd.DataFrame, nominal_columns: list) -> pd.DataFrame:
+class OneHotEncoder:
+    """
+    One-hot encoder with a frozen category vocabulary.
+
+    fit collects the categories of every nominal column (from one DataFrame or
+    an iterable of chunks) and freezes them, so every chunk and every re-run
+    produces the same columns in the same order. Categories seen fewer than
+    min_frequency times share one infrequent bucket column, and so do unseen
+    categories if handle_unknown='infrequent'. transform builds the indicator
+    matrix directly as scipy.sparse CSR (one non-zero per encoded value) and
+    returns it as is, as sparse pandas columns or as dense bool columns like
+    pd.get_dummies. inverse_transform decodes the indicators back with one
+    argmax per column group.
+    """
+
+    HANDLE_UNKNOWN = ("ignore", "infrequent", "error")
+    OUTPUTS = ("dense", "sparse", "csr")
+
+    def __init__(self, columns: list, min_frequency=None, handle_unknown: str = "ignore", infrequent_label: str = "infrequent"):
+        """
+        Parameters:
+        - columns: list
+            Nominal columns to encode.
+        - min_frequency: int or float, optional
+            Categories seen fewer times (int) or in a smaller share of rows (float) go to the infrequent bucket.
+        - handle_unknown: str
+            'ignore' encodes unseen categories as all-zero rows, 'infrequent' puts them in the
+            infrequent bucket and 'error' raises a ValueError.
+        - infrequent_label: str
+            Category name of the infrequent bucket (the column is named '<column>_<infrequent_label>').
+        """
+        if handle_unknown not in self.HANDLE_UNKNOWN:
+            raise ValueError(f"Unknown handle_unknown: {handle_unknown}. Use one of {self.HANDLE_UNKNOWN}.")
+        self.columns = list(columns)
+        self.min_frequency = min_frequency
+        self.handle_unknown = handle_unknown
+        self.infrequent_label = infrequent_label
+        self.categories_ = None
+        self.infrequent_ = None
+
+    def fit(self, data) -> "OneHotEncoder":
+        """
+        Freeze the vocabulary of every column.
+
+        Parameters:
+        - data: pd.DataFrame or iterable
+            A DataFrame, or an iterable of DataFrame chunks.
+
+        Returns:
+        - The fitted OneHotEncoder
+        """
+        counts = {col: None for col in self.columns}
+        declared = {}
+        n_rows = 0
+        for chunk in [data] if isinstance(data, pd.DataFrame) else data:
+            n_rows += len(chunk)
+            for col in self.columns:
+                if isinstance(chunk[col].dtype, pd.CategoricalDtype):
+                    declared.setdefault(col, list(chunk[col].cat.categories))
+                chunk_counts = chunk[col].value_counts(dropna=True, sort=False)
+                counts[col] = chunk_counts if counts[col] is None else counts[col].add(chunk_counts, fill_value=0)
+
+        threshold = self.min_frequency
+        if isinstance(threshold, float):
+            threshold = threshold * n_rows
+        self.categories_, self.infrequent_ = {}, {}
+        for col in self.columns:
+            col_counts = counts[col] if counts[col] is not None else pd.Series(dtype=float)
+            # Like get_dummies: declared categorical order, otherwise sorted categories
+            categories = declared[col] if col in declared else _sorted(col_counts.index[col_counts > 0])
+            rare = set() if threshold is None else set(col_counts.index[col_counts < threshold])
+            self.categories_[col] = [_to_python(cat) for cat in categories if cat not in rare]
+            self.infrequent_[col] = [_to_python(cat) for cat in categories if cat in rare]
+        return self
+
+    def transform(self, df: pd.DataFrame, output: str = "dense", inplace: bool = False):
+        """
+        One-hot encode the fitted columns.
+
+        Parameters:
+        - df: pd.DataFrame
+            The DataFrame (or chunk) to encode.
+        - output: str
+            'dense' (bool columns like pd.get_dummies), 'sparse' (pandas sparse columns) or 'csr'.
+        - inplace: bool
+            If True, modify df itself (not used for 'csr'). Otherwise the remaining columns are shared with df.
+
+        Returns:
+        - pd.DataFrame with the nominal columns replaced by their indicator columns,
+          or for 'csr' a scipy.sparse.csr_matrix of the indicators (columns as in feature_names())
+        """
+        if output not in self.OUTPUTS:
+            raise ValueError(f"Unknown output: {output}. Use one of {self.OUTPUTS}.")
+        matrix = self._indicator_matrix(df)
+        if output == "csr":
+            return matrix
+        names = self.feature_names()
+        if output == "sparse":
+            encoded = pd.DataFrame.sparse.from_spmatrix(matrix.astype(bool), index=df.index, columns=names)
+        else:
+            encoded = pd.DataFrame(matrix.toarray().astype(bool), index=df.index, columns=names)
+        # One concat instead of inserting thousands of columns one block at a time
+        combined = pd.concat([df.drop(columns=self.columns), encoded], axis=1)
+        if not inplace:
+            return combined
+        # Swap the combined frame into df in one step, the way pandas' own inplace methods do
+        df._update_inplace(combined)
+        return df
+
+    def fit_transform(self, df: pd.DataFrame, output: str = "dense", inplace: bool = False):
+        """
+        Fit on df and encode it.
+        """
+        return self.fit(df).transform(df, output=output, inplace=inplace)
+
+    def inverse_transform(self, data, index=None, inplace: bool = False) -> pd.DataFrame:
+        """
+        Decode indicator columns back into the nominal columns (as pd.Categorical).
+
+        Parameters:
+        - data: pd.DataFrame or scipy.sparse matrix
+            Output of transform. Rows without any indicator set decode to NaN.
+        - index: optional
+            Index of the result when data is a sparse matrix.
+        - inplace: bool
+            If True, modify data itself (DataFrame input only). Otherwise the remaining columns are shared.
+
+        Returns:
+        - pd.DataFrame
+            The DataFrame with the indicator columns replaced by the nominal columns,
+            or for matrix input a DataFrame with just the nominal columns.
+        """
+        groups = self._group_labels()
+        if sparse.issparse(data):
+            decoded = _decode_sparse_groups(data, groups)
+            return pd.DataFrame(decoded, index=index if index is not None else pd.RangeIndex(data.shape[0]))
+
+        columns = self.feature_names()
+        if all(isinstance(dtype, pd.SparseDtype) for dtype in data[columns].dtypes):
+            decoded = _decode_sparse_groups(data[columns].sparse.to_coo(), groups)
+        else:
+            decoded, start = {}, 0
+            for col, labels in groups.items():
+                decoded[col] = _decode_indicators(_indicator_block(data[columns[start:start + len(labels)]]), labels)
+                start += len(labels)
+        out = prepare_output(data, inplace)
+        out.drop(columns=columns, inplace=True)
+        for col, values in decoded.items():
+            out[col] = values
+        return out
+
+    def feature_names(self) -> list:
+        """
+        Names of the indicator columns, in output order.
+        """
+        return [f"{col}_{label}" for col, labels in self._group_labels().items() for label in labels]
+
+    def to_dict(self) -> dict:
+        """
+        Serializable (JSON-compatible for numeric and string categories) representation.
+        """
+        return {"columns": self.columns, "min_frequency": self.min_frequency, "handle_unknown": self.handle_unknown,
+                "infrequent_label": self.infrequent_label, "categories": self.categories_, "infrequent": self.infrequent_}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "OneHotEncoder":
+        """
+        Restore a fitted encoder from to_dict output.
+        """
+        encoder = cls(state["columns"], state.get("min_frequency"), state.get("handle_unknown", "ignore"),
+                      state.get("infrequent_label", "infrequent"))
+        encoder.categories_ = state.get("categories")
+        encoder.infrequent_ = state.get("infrequent")
+        return encoder
+
+    def _group_labels(self) -> dict:
+        if self.categories_ is None:
+            raise ValueError("The encoder is not fitted yet. Call fit first.")
+        labels = {}
+        for col in self.columns:
+            bucket = bool(self.infrequent_[col]) or self.handle_unknown == "infrequent"
+            labels[col] = self.categories_[col] + ([self.infrequent_label] if bucket else [])
+        return labels
+
+    def _indicator_matrix(self, df: pd.DataFrame) -> sparse.csr_matrix:
+        groups = self._group_labels()
+        n_rows = len(df)
+        indices, offset = [], 0
+        for col, labels in groups.items():
+            known = self.categories_[col] + self.infrequent_[col]
+            # Infrequent categories all point at the bucket column (the last one of the group)
+            targets = np.r_[np.arange(len(self.categories_[col])), np.full(len(self.infrequent_[col]), len(labels) - 1)]
+            codes = pd.Index(known).get_indexer(df[col])
+            unknown = (codes == -1) & df[col].notna().to_numpy()
+            if unknown.any() and self.handle_unknown == "error":
+                raise ValueError(f"Unknown categories in column '{col}': {list(pd.unique(df[col][unknown]))[:10]}")
+            column_idx = np.where(codes >= 0, targets[np.maximum(codes, 0)] if len(targets) else 0, -1)
+            if self.handle_unknown == "infrequent":
+                column_idx[unknown] = len(labels) - 1
+            indices.append(np.where(column_idx >= 0, column_idx + offset, -1))
+            offset += len(labels)
+        # One slot per (row, nominal column); -1 marks NaN/ignored values
+        slots = np.column_stack(indices) if indices else np.empty((n_rows, 0), dtype=np.intp)
+        filled = slots >= 0
+        indptr = np.r_[0, np.cumsum(filled.sum(axis=1))]
+        data = np.ones(int(indptr[-1]), dtype=np.uint8)
+        return sparse.csr_matrix((data, slots[filled], indptr), shape=(n_rows, offset))
+
+
+def _decode_indicators(block: np.ndarray, labels: list) -> pd.Categorical:
+    """
+    Decode one group of dense indicator columns into a Categorical via argmax;
+    rows without any indicator set become NaN.
+    """
+    if block.shape[1]:
+        codes = np.where(block.any(axis=1), block.argmax(axis=1), -1)
+    else:
+        codes = np.full(len(block), -1)
+    return pd.Categorical.from_codes(codes, categories=pd.Index(labels, dtype=object))
+
+
+def _indicator_block(block: pd.DataFrame) -> np.ndarray:
+    """
+    Numeric block of indicator columns in their native dtype (bool stays bool); NaN counts as 0.
+    """
+    values = block.to_numpy()
+    if values.dtype == object:
+        values = block.astype(float).to_numpy()
+    if values.dtype.kind == "f" and np.isnan(values).any():
+        values = np.nan_to_num(values, nan=0.0)
+    return values
+
+
+def _decode_sparse_groups(matrix, groups: dict) -> dict:
+    """
+    Decode consecutive groups of sparse indicator columns straight from the non-zero entries.
+    Like argmax, the first set column of a group wins.
+    """
+    coo = sparse.coo_matrix(matrix)
+    nonzero = coo.data != 0
+    rows, cols = coo.row[nonzero], coo.col[nonzero]
+
+    starts = np.cumsum([0] + [len(labels) for labels in groups.values()])
+    group_of = np.searchsorted(starts, cols, side="right") - 1
+    decoded = {}
+    for g, (col, labels) in enumerate(groups.items()):
+        in_group = group_of == g
+        # Keep the leftmost set column per row; rows without any stay at len(labels) and become NaN
+        codes = np.full(coo.shape[0], len(labels))
+        np.minimum.at(codes, rows[in_group], cols[in_group] - starts[g])
+        codes[codes == len(labels)] = -1
+        decoded[col] = pd.Categorical.from_codes(codes, categories=pd.Index(labels, dtype=object))
+    return decoded
+
+
+def _sorted(categories) -> list:
+    """
+    Sorted categories; falls back to order of appearance for unorderable mixed types.
+    """
+    try:
+        return sorted(categories)
+    except TypeError:
+        return list(categories)
+
+
+def _to_python(value):
+    """
+    Convert numpy scalars to plain Python values so vocabularies serialize cleanly.
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def nominal_to_one_hot(df: pd.DataFrame, nominal_columns: list, inplace: bool = False, output: str = "dense",
+                       min_frequency=None) -> pd.DataFrame:
     """
     One-hot encodes the specified nominal columns of a DataFrame.
 
+    To encode later chunks or new data with the same columns, fit a OneHotEncoder once and reuse it.
+
     Parameters:
     - df: pd.DataFrame
         The input DataFrame.
     - nominal_columns: list
         List of column names to be one-hot encoded.
+    - inplace: bool
+        If True, modify df itself. Otherwise the remaining columns are shared with df.
+    - output: str
+        'dense' (bool columns), 'sparse' (pandas sparse columns) or 'csr' (a scipy.sparse matrix of just the indicators).
+    - min_frequency: int or float, optional
+        Categories rarer than this share one '<column>_infrequent' column.
+
+    Returns:
+    - pd.DataFrame
+        A DataFrame with the specified columns one-hot encoded (or a csr_matrix for output='csr').
+    """
+    return OneHotEncoder(nominal_columns, min_frequency=min_frequency).fit_transform(df, output=output, inplace=inplace)
+
+def one_hot_to_nominal(df: pd.DataFrame, original_column, one_hot_columns: list = None, inplace: bool = False,
+                       all_zero: str = "nan") -> pd.DataFrame:
+    """
+    Reverts a one-hot encoding back into nominal columns.
+
+    Each group is decoded with one argmax over its numeric block, and the indices are mapped
+    straight into a pd.Categorical whose categories are the column names without the
+    '<original_column>_' prefix.
+
+    Parameters:
+    - df: pd.DataFrame
+        The input DataFrame.
+    - original_column: str or dict
+        Name of the nominal column to restore, or a dict mapping several nominal column names
+        to their one-hot columns to decode them all in one call.
+    - one_hot_columns: list, optional
+        The one-hot columns belonging to original_column (when it is a str).
+    - inplace: bool
+        If True, modify df itself. Otherwise the remaining columns are shared with df.
+    - all_zero: str
+        What rows without any indicator set decode to: 'nan', 'first' (the first category,
+        like idxmax) or 'error' to raise a ValueError.
 
     Returns:
     - pd.DataFrame
-        A DataFrame with the specified columns one-hot encoded.
+        A DataFrame with the one-hot columns replaced by the nominal (categorical) columns.
     """
-    return pd.get_dummies(df, columns=nominal_columns, drop_first=False)
+    if all_zero not in ("nan", "first", "error"):
+        raise ValueError(f"Unknown all_zero: {all_zero}. Use 'nan', 'first' or 'error'.")
+    groups = original_column if isinstance(original_column, dict) else {original_column: one_hot_columns}
+
+    decoded = {}
+    for name, columns in groups.items():
+        columns = list(columns)
+        prefix = f"{name}_"
+        labels = [col[len(prefix):] if isinstance(col, str) and col.startswith(prefix) else col for col in columns]
+        block = df[columns]
+        if len(columns) and all(isinstance(dtype, pd.SparseDtype) for dtype in block.dtypes):
+            values = _decode_sparse_groups(block.sparse.to_coo(), {name: labels})[name]
+        else:
+            values = _decode_indicators(_indicator_block(block), labels)
+        empty = values.isna()
+        if empty.any() and len(columns):
+            if all_zero == "error":
+                raise ValueError(f"{int(empty.sum())} rows have no one-hot indicator set for '{name}'.")
+            if all_zero == "first":
+                values = values.fillna(labels[0])
+        decoded[name] = values
 
-def one_hot_to_nominal(df: pd.DataFrame, original_column: str, one_hot_columns: list) -> pd.DataFrame:
-    df[original_column] = df[one_hot_columns].idxmax(axis=1).str.replace(f"{original_column}_", "")
-    return df.drop(columns=one_hot_columns)
+    out = prepare_output(df, inplace)
+    for name, values in decoded.items():
+        out[name] = pd.Series(values, index=df.index)
+    out.drop(columns=[col for columns in groups.values() for col in columns], inplace=True)
+    return out
 
 
-def numeric_to_categorical(df: pd.DataFrame, numeric_columns: list, bins: dict) -> pd.DataFrame:
+def numeric_to_categorical(df: pd.DataFrame, numeric_columns: list, bins: dict, inplace: bool = False) -> pd.DataFrame:
     """
     Categorizes numeric columns into bins.
 
@@ -54,12 +392,15 @@ def numeric_to_categorical(df: pd.DataFrame, numeric_columns: list, bins: dict)
         List of column names to be categorized.
     - bins: dict
         Dictionary where keys are column names and values are lists of bin edges.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
     - pd.DataFrame
         A DataFrame with the specified numeric columns categorized.
     """
+    out = prepare_output(df, inplace)
     for col in numeric_columns:
         if col in bins:
-            df[col] = pd.cut(df[col], bins=bins[col], labels=False)
-    return df
\ No newline at end of file
+            out[col] = pd.cut(df[col], bins=bins[col], labels=False)
+    return out
\ No newline at end of file
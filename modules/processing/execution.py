@@ -0,0 +1,73 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+def prepare_output(df: pd.DataFrame, inplace: bool) -> pd.DataFrame:
+    """
+    Returns the DataFrame a processing step writes its results into.
+
+    With inplace=True this is df itself. Otherwise it is a shallow copy whose
+    column arrays are shared with df, so a step that only assigns whole columns
+    (out[col] = ...) allocates memory just for the columns it changes and never
+    modifies df. A chain of such steps therefore costs at most one copy of each
+    changed column. Steps must not write into existing column arrays
+    (e.g. out.loc[mask, col] = ...), since without copy-on-write those writes
+    would reach df.
+
+    Parameters:
+    - df: pd.DataFrame
+        The input DataFrame.
+    - inplace: bool
+        Whether the step should modify df itself.
+
+    Returns:
+    - pd.DataFrame
+        df or a shallow copy of it.
+    """
+    return df if inplace else df.copy(deep=False)
+
+
+def drop_rows(df: pd.DataFrame, keep: np.ndarray) -> pd.DataFrame:
+    """
+    Drops the rows where keep is False from df itself, by position.
+
+    DataFrame.drop works on labels, so with duplicate index labels it would also
+    remove kept rows that share a label with a dropped one. The index is swapped
+    for a positional one for the drop and restored afterwards.
+
+    Parameters:
+    - df: pd.DataFrame
+        The DataFrame to drop rows from (modified in place).
+    - keep: np.ndarray
+        Boolean mask of the rows to keep, one entry per row of df.
+
+    Returns:
+    - pd.DataFrame
+        df itself.
+    """
+    keep = np.asarray(keep, dtype=bool)
+    index = df.index
+    df.reset_index(drop=True, inplace=True)
+    df.drop(index=np.flatnonzero(~keep), inplace=True)
+    df.index = index[keep]
+    return df
+
+
+def fingerprint(df: pd.DataFrame, params: tuple) -> str:
+    """
+    Hash of the DataFrame content and the parameters, used as a cache key.
+
+    Parameters:
+    - df: pd.DataFrame
+        The data the cached result was computed from (the index is ignored).
+    - params: tuple
+        The parameters of the computation; their repr is hashed.
+
+    Returns:
+    - str
+        Hex SHA-1 digest.
+    """
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(repr(params).encode())
+    return digest.hexdigest()
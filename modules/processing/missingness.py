@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+
+class MissingnessIndex:
+    """
+    Bit-packed null masks of a DataFrame, computed once per dataset version.
+
+    Holds one np.packbits mask per column plus per-column and per-row null
+    counts, so NaN-related steps (dropping, flagging, overviews, heatmaps) can
+    answer from the index instead of rescanning the frame with isnull(). When a
+    step only changes some columns, update() rescans just those columns.
+    """
+
+    def __init__(self, df: pd.DataFrame = None):
+        """
+        Parameters:
+        - df: Optional, DataFrame to index right away
+        """
+        self.n_rows = 0
+        self.columns = []
+        self._masks = {}
+        self._null_counts = {}
+        self.row_null_counts = np.zeros(0, dtype=np.int32)
+        if df is not None:
+            self.n_rows = len(df)
+            self.row_null_counts = np.zeros(len(df), dtype=np.int32)
+            self.update(df, df.columns)
+
+    def update(self, df: pd.DataFrame, columns) -> "MissingnessIndex":
+        """
+        Rescans the given columns of df (new or changed) and adjusts the row counts.
+
+        Parameters:
+        - df: DataFrame the index describes, with the same rows as before
+        - columns: Columns that were added or changed
+
+        Returns:
+        - self
+        """
+        if len(df) != self.n_rows:
+            raise ValueError("Row count changed; use take() or rebuild the index.")
+        for col in columns:
+            mask = df[col].isna().to_numpy()
+            if col in self._masks:
+                self.row_null_counts -= self.mask(col)
+            else:
+                self.columns.append(col)
+            self.row_null_counts += mask
+            self._masks[col] = np.packbits(mask)
+            self._null_counts[col] = int(mask.sum())
+        return self
+
+    def drop(self, columns) -> "MissingnessIndex":
+        """
+        Removes columns from the index.
+        """
+        for col in columns:
+            if col in self._masks:
+                self.row_null_counts -= self.mask(col)
+                del self._masks[col], self._null_counts[col]
+                self.columns.remove(col)
+        return self
+
+    def rename(self, mapping: dict) -> "MissingnessIndex":
+        """
+        Renames indexed columns without rescanning them.
+        """
+        for old, new in mapping.items():
+            if old in self._masks:
+                self._masks[new] = self._masks.pop(old)
+                self._null_counts[new] = self._null_counts.pop(old)
+                self.columns[self.columns.index(old)] = new
+        return self
+
+    def take(self, keep: np.ndarray) -> "MissingnessIndex":
+        """
+        Keeps only the rows where keep is True (e.g. after dropping rows).
+        """
+        keep = np.asarray(keep, dtype=bool)
+        for col in self.columns:
+            mask = self.mask(col)[keep]
+            self._masks[col] = np.packbits(mask)
+            self._null_counts[col] = int(mask.sum())
+        self.row_null_counts = self.row_null_counts[keep]
+        self.n_rows = int(keep.sum())
+        return self
+
+    def mask(self, col: str) -> np.ndarray:
+        """
+        Boolean null mask of one column.
+        """
+        return np.unpackbits(self._masks[col], count=self.n_rows).astype(bool)
+
+    def null_counts(self) -> pd.Series:
+        """
+        Number of nulls per column, in column order.
+        """
+        return pd.Series([self._null_counts[col] for col in self.columns], index=self.columns, dtype=int)
+
+    def null_fraction(self) -> pd.Series:
+        """
+        Share of nulls per column, in column order.
+        """
+        return self.null_counts() / max(self.n_rows, 1)
+
+    def rows_with_nulls(self, subset=None) -> np.ndarray:
+        """
+        Boolean mask of rows with at least one null (in subset, if given).
+        """
+        if subset is None:
+            return self.row_null_counts > 0
+        if len(subset) == 0:
+            return np.zeros(self.n_rows, dtype=bool)
+        packed = np.bitwise_or.reduce([self._masks[col] for col in subset])
+        return np.unpackbits(packed, count=self.n_rows).astype(bool)
+
+    def matrix(self, columns=None) -> np.ndarray:
+        """
+        Dense boolean null matrix (rows x columns), e.g. for plotting.
+        """
+        columns = self.columns if columns is None else columns
+        if not columns:
+            return np.zeros((self.n_rows, 0), dtype=bool)
+        return np.column_stack([self.mask(col) for col in columns])
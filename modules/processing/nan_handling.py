@@ -1,147 +1,399 @@
 import pandas as pd
 import numpy as np
+import time
+import warnings
+from modules.processing.execution import prepare_output, drop_rows
+from modules.processing.missingness import MissingnessIndex
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.impute import KNNImputer
+from sklearn.neighbors import NearestNeighbors
+from sklearn.linear_model import BayesianRidge
 from sklearn.experimental import enable_iterative_imputer
 from sklearn.impute import IterativeImputer
+from sklearn.exceptions import ConvergenceWarning
 
-def drop_rows_with_nan(df: pd.DataFrame, subset=None) -> pd.DataFrame:
+def drop_rows_with_nan(df: pd.DataFrame, subset=None, inplace=False, missing_index: MissingnessIndex = None) -> pd.DataFrame:
     """
     Drop rows that contain NaN values.
 
     Parameters:
         df (pd.DataFrame): The input DataFrame.
         subset (list, optional): List of column names to consider for NaN. If None, all columns are checked.
+        inplace (bool): If True, drop the rows from df itself.
+        missing_index (MissingnessIndex, optional): Index of df to answer from; it is updated to describe the result.
 
     Returns:
         pd.DataFrame: DataFrame with specified rows dropped.
     """
+    if missing_index is not None:
+        keep = ~missing_index.rows_with_nulls(subset)
+        missing_index.take(keep)
+        if inplace:
+            return drop_rows(df, keep)
+        return df[keep]
+    if inplace:
+        df.dropna(subset=subset, inplace=True)
+        return df
     return df.dropna(subset=subset)
 
-def drop_columns_with_nan(df: pd.DataFrame, threshold: float = 0.5) -> pd.DataFrame:
+def drop_columns_with_nan(df: pd.DataFrame, threshold: float = 0.5, inplace: bool = False, missing_index: MissingnessIndex = None) -> pd.DataFrame:
     """
     Drop columns with a proportion of NaN values greater than the threshold.
 
     Parameters:
         df (pd.DataFrame): The input DataFrame.
         threshold (float): Maximum allowed proportion of NaNs in a column (between 0 and 1).
+        inplace (bool): If True, drop the columns from df itself. Otherwise the kept columns are shared with df.
+        missing_index (MissingnessIndex, optional): Index of df to answer from; it is updated to describe the result.
 
     Returns:
         pd.DataFrame: DataFrame with specified columns dropped.
     """
-    return df.loc[:, df.isnull().mean() < threshold]
-
-def fill_with_constant(df: pd.DataFrame, value=0) -> pd.DataFrame:
+    null_fraction = missing_index.null_fraction() if missing_index is not None else df.isnull().mean()
+    dropped = list(null_fraction.index[~(null_fraction < threshold)])
+    out = prepare_output(df, inplace)
+    out.drop(columns=dropped, inplace=True)
+    if missing_index is not None:
+        missing_index.drop(dropped)
+    return out
+
+def fill_with_constant(df: pd.DataFrame, value=0, inplace=False, missing_index: MissingnessIndex = None) -> pd.DataFrame:
     """
     Fill all NaN values in the DataFrame with a constant.
 
     Parameters:
         df (pd.DataFrame): The input DataFrame.
-        value (any): Constant value to replace NaNs.
+        value (any): Constant value to replace NaNs, or a dict of column to value.
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
+        missing_index (MissingnessIndex, optional): Index of df to answer from; it is updated to describe the result.
 
     Returns:
         pd.DataFrame: DataFrame with NaNs replaced by the given value.
     """
-    return df.fillna(value)
-
-def fill_with_mean(df: pd.DataFrame, columns=None) -> pd.DataFrame:
+    if missing_index is not None:
+        null_counts = missing_index.null_counts()
+        columns = list(null_counts.index[null_counts > 0])
+    else:
+        columns = list(df.columns[df.isna().any()])
+    out = prepare_output(df, inplace)
+    for col in columns:
+        # A dict gives one fill value per column; columns it doesn't name keep their NaNs
+        col_value = value.get(col) if isinstance(value, dict) else value
+        if col_value is not None:
+            out[col] = df[col].fillna(col_value)
+    if missing_index is not None:
+        missing_index.update(out, columns)
+    return out
+
+def fill_with_mean(df: pd.DataFrame, columns=None, inplace=False, missing_index: MissingnessIndex = None) -> pd.DataFrame:
     """
     Fill NaN values in specified or all numeric columns with the column mean.
 
     Parameters:
         df (pd.DataFrame): The input DataFrame.
         columns (list, optional): Columns to impute. If None, all numeric columns are used.
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
+        missing_index (MissingnessIndex, optional): Index of df to answer from; it is updated to describe the result.
 
     Returns:
         pd.DataFrame: DataFrame with NaNs filled with mean values.
     """
-    df_copy = df.copy()
     if columns is None:
         columns = df.select_dtypes(include=np.number).columns
-    for col in columns:
-        df_copy[col] = df_copy[col].fillna(df_copy[col].mean())
-    return df_copy
+    return FillImputer({"mean": list(columns)}).fit_transform(df, inplace=inplace, missing_index=missing_index)
 
-def fill_with_median(df: pd.DataFrame, columns=None) -> pd.DataFrame:
+def fill_with_median(df: pd.DataFrame, columns=None, inplace=False, missing_index: MissingnessIndex = None) -> pd.DataFrame:
     """
     Fill NaN values in specified or all numeric columns with the column median.
 
     Parameters:
         df (pd.DataFrame): The input DataFrame.
         columns (list, optional): Columns to impute. If None, all numeric columns are used.
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
+        missing_index (MissingnessIndex, optional): Index of df to answer from; it is updated to describe the result.
 
     Returns:
         pd.DataFrame: DataFrame with NaNs filled with median values.
     """
-    df_copy = df.copy()
     if columns is None:
         columns = df.select_dtypes(include=np.number).columns
-    for col in columns:
-        df_copy[col] = df_copy[col].fillna(df_copy[col].median())
-    return df_copy
+    return FillImputer({"median": list(columns)}).fit_transform(df, inplace=inplace, missing_index=missing_index)
 
-def fill_with_mode(df: pd.DataFrame, columns=None) -> pd.DataFrame:
+def fill_with_mode(df: pd.DataFrame, columns=None, inplace=False, missing_index: MissingnessIndex = None) -> pd.DataFrame:
     """
     Fill NaN values in specified or all columns with the column mode.
 
     Parameters:
         df (pd.DataFrame): The input DataFrame.
         columns (list, optional): Columns to impute. If None, all columns are used.
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
+        missing_index (MissingnessIndex, optional): Index of df to answer from; it is updated to describe the result.
 
     Returns:
         pd.DataFrame: DataFrame with NaNs filled with mode values.
     """
-    df_copy = df.copy()
     if columns is None:
         columns = df.columns
-    for col in columns:
-        mode = df_copy[col].mode()
-        if not mode.empty:
-            df_copy[col] = df_copy[col].fillna(mode[0])
-    return df_copy
+    return FillImputer({"mode": list(columns)}).fit_transform(df, inplace=inplace, missing_index=missing_index)
+
+class FillImputer:
+    """
+    Fit/transform imputer for mean, median and mode fills.
+
+    fit computes the statistics of all requested columns with one vectorized
+    call per strategy; transform applies every fill in a single fillna, either in
+    place or into one output copy. The fitted fill values can be serialized with
+    to_dict and restored with from_dict, e.g. to reuse them on later chunks or
+    to persist them with the project.
+    """
 
-def forward_fill(df: pd.DataFrame) -> pd.DataFrame:
+    STRATEGIES = ("mean", "median", "mode")
+
+    def __init__(self, strategies: dict = None):
+        """
+        Parameters:
+            strategies (dict, optional): Mapping of strategy ('mean', 'median' or 'mode') to a list of columns.
+        """
+        strategies = strategies or {}
+        unknown = set(strategies) - set(self.STRATEGIES)
+        if unknown:
+            raise ValueError(f"Unknown imputation strategies: {unknown}. Use one of {self.STRATEGIES}.")
+        self.strategies = {strategy: list(columns) for strategy, columns in strategies.items()}
+        self.fill_values_ = None
+
+    def fit(self, df: pd.DataFrame) -> "FillImputer":
+        """
+        Compute the fill value of every requested column.
+
+        Parameters:
+            df (pd.DataFrame): The DataFrame to compute the statistics on.
+
+        Returns:
+            FillImputer: The fitted imputer.
+        """
+        fill_values = {}
+        for strategy, columns in self.strategies.items():
+            if not columns:
+                continue
+            if strategy == "mean":
+                stats = df[columns].mean()
+            elif strategy == "median":
+                stats = df[columns].median()
+            else:
+                modes = df[columns].mode()
+                stats = modes.iloc[0] if not modes.empty else pd.Series(dtype=object)
+            # All-NaN columns have no statistic and are left untouched
+            fill_values.update({col: _to_python(value) for col, value in stats.items() if not pd.isna(value)})
+        self.fill_values_ = fill_values
+        return self
+
+    def transform(self, df: pd.DataFrame, inplace: bool = False, missing_index: MissingnessIndex = None) -> pd.DataFrame:
+        """
+        Fill NaN values with the fitted statistics.
+
+        Parameters:
+            df (pd.DataFrame): The input DataFrame.
+            inplace (bool): If True, fill df itself. Otherwise only the filled columns are copied.
+            missing_index (MissingnessIndex, optional): Index of df to answer from; it is updated to describe the result.
+
+        Returns:
+            pd.DataFrame: DataFrame with NaNs filled (df itself if inplace).
+        """
+        if self.fill_values_ is None:
+            raise ValueError("FillImputer is not fitted yet. Call fit first.")
+        if missing_index is not None:
+            null_counts = missing_index.null_counts()
+        else:
+            null_counts = pd.Series({col: int(df[col].hasnans) for col in self.fill_values_ if col in df.columns}, dtype=int)
+        filled = [col for col in self.fill_values_ if col in df.columns and null_counts.get(col, 0) > 0]
+
+        out = prepare_output(df, inplace)
+        for col in filled:
+            out[col] = df[col].fillna(self.fill_values_[col])
+        if missing_index is not None:
+            missing_index.update(out, filled)
+        return out
+
+    def fit_transform(self, df: pd.DataFrame, inplace: bool = False, missing_index: MissingnessIndex = None) -> pd.DataFrame:
+        """
+        Fit on df and fill it in one call.
+        """
+        return self.fit(df).transform(df, inplace=inplace, missing_index=missing_index)
+
+    def to_dict(self) -> dict:
+        """
+        Serializable (JSON-compatible for numeric and string columns) representation.
+        """
+        return {"strategies": self.strategies, "fill_values": self.fill_values_}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "FillImputer":
+        """
+        Restore a fitted imputer from to_dict output.
+        """
+        imputer = cls(state.get("strategies"))
+        imputer.fill_values_ = state.get("fill_values")
+        return imputer
+
+def _to_python(value):
+    """
+    Convert numpy scalars to plain Python values so fill values serialize cleanly.
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+def forward_fill(df: pd.DataFrame, inplace=False) -> pd.DataFrame:
     """
     Forward-fill NaN values (propagate last valid value forward).
 
     Parameters:
         df (pd.DataFrame): The input DataFrame.
+        inplace (bool): If True, fill df itself.
 
     Returns:
         pd.DataFrame: DataFrame with NaNs forward-filled.
     """
+    if inplace:
+        df.ffill(inplace=True)
+        return df
     return df.ffill()
 
-def backward_fill(df: pd.DataFrame) -> pd.DataFrame:
+def backward_fill(df: pd.DataFrame, inplace=False) -> pd.DataFrame:
     """
     Backward-fill NaN values (propagate next valid value backward).
 
     Parameters:
         df (pd.DataFrame): The input DataFrame.
+        inplace (bool): If True, fill df itself.
 
     Returns:
         pd.DataFrame: DataFrame with NaNs backward-filled.
     """
+    if inplace:
+        df.bfill(inplace=True)
+        return df
     return df.bfill()
 
-def knn_impute(df: pd.DataFrame, n_neighbors=5) -> pd.DataFrame:
+def knn_impute(df: pd.DataFrame, n_neighbors=5, method="full", memory_budget_mb=256, max_donors=None, n_jobs=None, random_state=0, inplace=False) -> pd.DataFrame:
     """
     Impute missing values using k-nearest neighbors (KNN) on numeric columns.
 
     Parameters:
         df (pd.DataFrame): The input DataFrame.
         n_neighbors (int): Number of neighbors to use for imputation.
+        method (str): 'full' runs sklearn's KNNImputer on the whole numeric frame (pairwise distances).
+            'donor' only searches neighbours for rows with missing values, among the complete rows,
+            using a tree index and blocked, multi-threaded queries (see _knn_impute_donors).
+        memory_budget_mb (float): Approximate memory per query block (only for 'donor').
+        max_donors (int, optional): Subsample the complete rows to at most this many donors (only for 'donor').
+        n_jobs (int, optional): Number of worker threads. None uses all cores (only for 'donor').
+        random_state (int): Seed for the donor subsample (only for 'donor').
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
         pd.DataFrame: DataFrame with numeric columns imputed using KNN.
     """
+    if method == "donor":
+        return _knn_impute_donors(df, n_neighbors, memory_budget_mb, max_donors, n_jobs, random_state, inplace)
+    if method != "full":
+        raise ValueError("Method must be 'full' or 'donor'.")
+
     imputer = KNNImputer(n_neighbors=n_neighbors)
     df_numeric = df.select_dtypes(include=np.number)
     imputed_array = imputer.fit_transform(df_numeric)
-    df_imputed = pd.DataFrame(imputed_array, columns=df_numeric.columns, index=df.index)
-    df_non_numeric = df.drop(columns=df_numeric.columns)
-    return pd.concat([df_imputed, df_non_numeric], axis=1)
+    return _write_imputed(df, _imputed_columns(df_numeric), imputed_array, inplace)
 
-def iterative_impute(df: pd.DataFrame, max_iter=10, random_state=0) -> pd.DataFrame:
+def _knn_impute_donors(df: pd.DataFrame, n_neighbors: int, memory_budget_mb: float, max_donors: int, n_jobs: int, random_state: int, inplace: bool) -> pd.DataFrame:
+    """
+    Donor-based KNN imputation.
+
+    Incomplete rows are grouped by missingness pattern. A frequent pattern gets
+    a tree index over the donors (complete rows) restricted to its observed
+    columns. Rows with rare patterns, where building a tree per pattern would
+    cost more than it saves, share one brute-force pass: their distances to all
+    donors are computed over each row's own observed columns with two matrix
+    products. Both kinds of rows are processed in blocks sized to the memory
+    budget across a thread pool. Missing values are filled with the unweighted
+    mean of the neighbours, like KNNImputer. All-NaN columns are left as they are.
+
+    Returns:
+        pd.DataFrame: DataFrame with numeric columns imputed.
+    """
+    numeric = df.select_dtypes(include=np.number)
+    columns = [col for col in numeric.columns if numeric[col].notna().any()]
+    values = numeric[columns].to_numpy(dtype=float, copy=True)
+    missing = np.isnan(values)
+    incomplete = np.flatnonzero(missing.any(axis=1))
+    donors = np.flatnonzero(~missing.any(axis=1))
+
+    if len(incomplete) == 0:
+        return prepare_output(df, inplace)
+    if len(donors) == 0:
+        raise ValueError("Donor KNN imputation needs at least one row without missing numeric values.")
+    if max_donors is not None and len(donors) > max_donors:
+        donors = np.sort(np.random.default_rng(random_state).choice(donors, max_donors, replace=False))
+
+    donor_values = values[donors]
+    donor_squares = donor_values ** 2
+    k = min(n_neighbors, len(donors))
+    n_features = values.shape[1]
+    budget = memory_budget_mb * 2 ** 20
+    tree_block = max(1, int(budget // (16 * k + 8 * k * n_features + 8 * n_features)))
+    # Brute-force pass: three distance-sized temporaries plus the argpartition indices
+    brute_block = max(1, int(budget // (32 * len(donors) + 24 * n_features)))
+    # A tree costs about len(donors) * log2(len(donors)) to build, a brute-force
+    # row len(donors): patterns with fewer rows than that log factor skip the tree
+    min_tree_rows = max(_KNN_MIN_TREE_ROWS, int(np.log2(len(donors))) * 4)
+
+    imputed = values[incomplete]
+    imputed_missing = missing[incomplete]
+    patterns, pattern_ids, pattern_counts = np.unique(imputed_missing, axis=0, return_inverse=True, return_counts=True)
+    pattern_ids = pattern_ids.ravel()
+    tasks = []
+    for pattern_id in np.flatnonzero(pattern_counts >= min_tree_rows):
+        pattern = patterns[pattern_id]
+        rows = np.flatnonzero(pattern_ids == pattern_id)
+        observed = ~pattern
+        if not observed.any():
+            # Nothing to measure distances on: fall back to the donor means
+            imputed[rows] = donor_values.mean(axis=0)
+            continue
+        index = NearestNeighbors(n_neighbors=k).fit(donor_values[:, observed])
+        for start in range(0, len(rows), tree_block):
+            tasks.append((index, rows[start:start + tree_block]))
+    rare = np.flatnonzero(pattern_counts[pattern_ids] < min_tree_rows)
+    for start in range(0, len(rare), brute_block):
+        tasks.append((None, rare[start:start + brute_block]))
+
+    def query(task):
+        index, rows = task
+        row_missing = imputed_missing[rows]
+        if index is not None:
+            neighbours = index.kneighbors(imputed[rows][:, ~row_missing[0]], return_distance=False)
+        else:
+            observed = (~row_missing).astype(float)
+            masked = np.where(row_missing, 0.0, imputed[rows])
+            # Squared distances over each row's observed columns; the row's own
+            # squared norm is the same for all donors and doesn't change the order
+            distances = observed @ donor_squares.T - 2 * masked @ donor_values.T
+            if k < len(donors):
+                neighbours = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            else:
+                neighbours = np.broadcast_to(np.arange(len(donors)), distances.shape)
+        fill = donor_values[neighbours].mean(axis=1)
+        fill[row_missing.all(axis=1)] = donor_values.mean(axis=0)
+        return rows, row_missing, fill
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for rows, row_missing, fill in pool.map(query, tasks):
+            imputed[rows] = np.where(row_missing, fill, imputed[rows])
+
+    values[incomplete] = imputed
+    return _write_imputed(df, columns, values, inplace)
+
+# Missingness patterns with fewer incomplete rows than this never get their own tree
+_KNN_MIN_TREE_ROWS = 32
+
+def iterative_impute(df: pd.DataFrame, max_iter=10, random_state=0, method="sklearn", n_nearest_features=None, tol=1e-3, n_jobs=None, progress_callback=None, inplace=False) -> pd.DataFrame:
     """
     Impute missing values using multivariate Iterative Imputer (e.g., MICE) on numeric columns.
 
@@ -149,18 +401,126 @@ def iterative_impute(df: pd.DataFrame, max_iter=10, random_state=0) -> pd.DataFr
         df (pd.DataFrame): The input DataFrame.
         max_iter (int): Maximum number of imputation iterations.
         random_state (int): Seed for reproducibility.
+        method (str): 'sklearn' runs sklearn's IterativeImputer. 'parallel' uses _iterative_impute_parallel,
+            which fits the regressions of columns that don't predict each other in parallel and reports progress.
+        n_nearest_features (int, optional): Use only the top-k predictors by absolute correlation
+            for each target column (only for 'parallel'). None uses the top 20, so that columns which
+            don't predict each other can be fitted in parallel.
+        tol (float): Stop when the largest change of the imputed values, relative to the largest
+            absolute observed value, drops below tol (only for 'parallel'). Also stops, with a warning,
+            when the change keeps growing instead of shrinking. A ConvergenceWarning is raised if
+            max_iter rounds pass without reaching tol.
+        n_jobs (int, optional): Number of worker threads. None uses all cores (only for 'parallel').
+        progress_callback (callable, optional): Called after every round as
+            progress_callback(round, max_iter, change, seconds) (only for 'parallel').
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
         pd.DataFrame: DataFrame with numeric columns imputed using iterative method.
     """
+    if method == "parallel":
+        return _iterative_impute_parallel(df, max_iter, n_nearest_features, tol, n_jobs, progress_callback, inplace)
+    if method != "sklearn":
+        raise ValueError("Method must be 'sklearn' or 'parallel'.")
+
     imputer = IterativeImputer(max_iter=max_iter, random_state=random_state)
     df_numeric = df.select_dtypes(include=np.number)
     imputed_array = imputer.fit_transform(df_numeric)
-    df_imputed = pd.DataFrame(imputed_array, columns=df_numeric.columns, index=df.index)
-    df_non_numeric = df.drop(columns=df_numeric.columns)
-    return pd.concat([df_imputed, df_non_numeric], axis=1)
+    return _write_imputed(df, _imputed_columns(df_numeric), imputed_array, inplace)
 
-def add_missing_flags(df: pd.DataFrame, columns=None, suffix="_missing") -> pd.DataFrame:
+def _iterative_impute_parallel(df: pd.DataFrame, max_iter: int, n_nearest_features: int, tol: float, n_jobs: int, progress_callback, inplace: bool) -> pd.DataFrame:
+    """
+    Round-based iterative imputation with per-column predictor sets.
+
+    Missing values start at the column means. In every round the incomplete
+    columns are regressed (BayesianRidge) on their predictors one after another,
+    fewest missing values first, each using the latest values of the others
+    (Gauss-Seidel, like IterativeImputer). The update order is split greedily
+    into batches of columns that are not predictors of each other; the
+    regressions of a batch run in a thread pool. Predictors are the top
+    n_nearest_features columns (_ITERATIVE_DEFAULT_PREDICTORS if None) by
+    absolute pairwise correlation, chosen once up front; with all columns as
+    predictors every batch would hold a single column. Predictions are clipped
+    to the observed range of the column. If the change stays above its smallest
+    value for _ITERATIVE_DIVERGENCE_ROUNDS rounds, the values of the round with
+    the smallest change are kept and a ConvergenceWarning is raised, as it is
+    when max_iter rounds pass without reaching tol. All-NaN columns are left as
+    they are.
+
+    Returns:
+        pd.DataFrame: DataFrame with numeric columns imputed.
+    """
+    numeric = df.select_dtypes(include=np.number)
+    columns = [col for col in numeric.columns if numeric[col].notna().any()]
+    values = numeric[columns].to_numpy(dtype=float, copy=True)
+    missing = np.isnan(values)
+    missing_counts = missing.sum(axis=0)
+    targets = [j for j in np.argsort(missing_counts, kind="stable") if missing_counts[j] > 0]
+
+    if len(targets) == 0:
+        return prepare_output(df, inplace)
+
+    low, high = np.nanmin(values, axis=0), np.nanmax(values, axis=0)
+    values[missing] = np.take(np.nanmean(values, axis=0), np.nonzero(missing)[1])
+    correlation = np.nan_to_num(np.abs(numeric[columns].corr().to_numpy()))
+    np.fill_diagonal(correlation, -1)
+    n_predictors = min(_ITERATIVE_DEFAULT_PREDICTORS if n_nearest_features is None else n_nearest_features, len(columns) - 1)
+    predictors = {j: np.argsort(-correlation[j])[:n_predictors] for j in targets}
+    scale = max(np.abs(values[~missing]).max(initial=0.0), 1e-12)
+
+    # Greedy colouring: each column joins the first batch with no column it
+    # predicts or is predicted by; batches run in order, so later batches see
+    # the values of earlier ones
+    batches = []
+    for j in targets:
+        for batch in batches:
+            if not any(j in predictors[i] or i in predictors[j] for i in batch):
+                batch.append(j)
+                break
+        else:
+            batches.append([j])
+
+    def fit_column(j):
+        if len(predictors[j]) == 0:
+            return j, values[missing[:, j], j]
+        observed = ~missing[:, j]
+        model = BayesianRidge().fit(values[np.ix_(observed, predictors[j])], values[observed, j])
+        return j, np.clip(model.predict(values[np.ix_(~observed, predictors[j])]), low[j], high[j])
+
+    best_change, best_values, rounds_worse, change = np.inf, None, 0, np.inf
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for round_ in range(1, max_iter + 1):
+            start = time.perf_counter()
+            change = 0.0
+            for batch in batches:
+                for j, prediction in list(pool.map(fit_column, batch)):
+                    change = max(change, float(np.abs(prediction - values[missing[:, j], j]).max(initial=0.0)))
+                    values[missing[:, j], j] = prediction
+            change = float(change / scale)
+            if progress_callback is not None:
+                progress_callback(round_, max_iter, change, time.perf_counter() - start)
+            if change < tol:
+                break
+            if change < best_change:
+                best_change, best_values, rounds_worse = change, values[missing], 0
+                continue
+            rounds_worse += 1
+            if rounds_worse == _ITERATIVE_DIVERGENCE_ROUNDS:
+                # The change keeps growing: keep the values of the round with the smallest change
+                values[missing] = best_values
+                warnings.warn(f"Iterative imputation stopped after round {round_}: the change grew above {best_change:.3g} for {rounds_worse} rounds.", ConvergenceWarning)
+                break
+        else:
+            warnings.warn(f"Iterative imputation reached max_iter={max_iter} without converging (change {change:.3g}, tol {tol:.3g}).", ConvergenceWarning)
+
+    return _write_imputed(df, columns, values, inplace)
+
+# Rounds the change may stay above its smallest value before the imputation is stopped
+_ITERATIVE_DIVERGENCE_ROUNDS = 3
+# Predictors per column when n_nearest_features is None
+_ITERATIVE_DEFAULT_PREDICTORS = 20
+
+def add_missing_flags(df: pd.DataFrame, columns=None, suffix="_missing", inplace=False, missing_index: MissingnessIndex = None) -> pd.DataFrame:
     """
     Add binary indicator columns for missing values.
 
@@ -168,13 +528,46 @@ def add_missing_flags(df: pd.DataFrame, columns=None, suffix="_missing") -> pd.D
         df (pd.DataFrame): The input DataFrame.
         columns (list, optional): Columns to flag. If None, all columns are considered.
         suffix (str): Suffix to append to original column names for the flags.
+        inplace (bool): If True, add the flags to df itself. Otherwise the existing columns are shared with df.
+        missing_index (MissingnessIndex, optional): Index of df to answer from; it is updated to describe the result.
 
     Returns:
         pd.DataFrame: DataFrame with added binary indicator columns.
     """
-    df_copy = df.copy()
+    out = prepare_output(df, inplace)
     if columns is None:
         columns = df.columns
     for col in columns:
-        df_copy[f"{col}{suffix}"] = df_copy[col].isna().astype(int)
-    return df_copy
+        mask = missing_index.mask(col) if missing_index is not None else df[col].isna()
+        out[f"{col}{suffix}"] = mask.astype(int)
+    if missing_index is not None:
+        missing_index.update(out, [f"{col}{suffix}" for col in columns])
+    return out
+
+def _imputed_columns(df_numeric: pd.DataFrame) -> pd.Index:
+    """
+    Labels of the columns a sklearn imputer returns, in order.
+
+    sklearn drops all-NaN columns and, for non-string labels, names the rest
+    'x0', 'x1', ..., so the output is mapped back through the input mask instead.
+    """
+    return df_numeric.columns[df_numeric.notna().any().to_numpy()]
+
+def _write_imputed(df: pd.DataFrame, columns, values: np.ndarray, inplace: bool) -> pd.DataFrame:
+    """
+    Write imputed numeric values back, replacing only the columns that had NaNs.
+
+    Parameters:
+        df (pd.DataFrame): The input DataFrame.
+        columns (list): Column names of the value matrix.
+        values (np.ndarray): Imputed values, one column per entry in columns.
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
+
+    Returns:
+        pd.DataFrame: DataFrame with the imputed columns.
+    """
+    out = prepare_output(df, inplace)
+    for i, col in enumerate(columns):
+        if df[col].hasnans:
+            out[col] = values[:, i]
+    return out
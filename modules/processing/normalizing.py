@@ -1,7 +1,201 @@
 import pandas as pd
 import numpy as np
+from modules.processing.execution import prepare_output
+from modules.processing.quantile_sketch import QuantileSketch
+from modules.processing.transforming import apply_transforms
 
-def z_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+
+class Scaler:
+    """
+    Fitted normalization for many columns at once.
+
+    fit accumulates the statistics the method needs in one pass over a
+    DataFrame or an iterable of chunks: a batched Welford/Chan update of mean
+    and variance for 'z', running min/max for 'min_max', exact quartiles (one
+    frame) or one QuantileSketch per column (chunks, partial_fit) for 'robust',
+    and a positivity check for 'log'. transform then applies the fitted
+    parameters as one vectorized (x - offset) / scale over the column block, so
+    new data and every chunk get the training statistics. to_dict/from_dict
+    persist the fitted state, e.g. with the project.
+    """
+
+    METHODS = ("z", "min_max", "robust", "log")
+
+    def __init__(self, method: str = "z", columns: list = None, sketch_error: float = 0.005):
+        """
+        Parameters:
+        - method: str
+            One of 'z', 'min_max', 'robust' or 'log'.
+        - columns: list, optional
+            Columns to normalize. If None, the numeric columns of the first fitted frame are used.
+        - sketch_error: float
+            Rank error of the quantile sketches used by 'robust' when fitting on chunks.
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown normalization method: {method}. Use one of {self.METHODS}.")
+        self.method = method
+        self.columns = list(columns) if columns is not None else None
+        self.sketch_error = sketch_error
+        self._reset()
+
+    def fit(self, data) -> "Scaler":
+        """
+        Compute the statistics from scratch.
+
+        Parameters:
+        - data: pd.DataFrame or iterable
+            A DataFrame, or an iterable of DataFrame chunks (e.g. pd.read_csv(..., chunksize=...)).
+
+        Returns:
+        - The fitted Scaler
+        """
+        self._reset()
+        if isinstance(data, pd.DataFrame) and self.method == "robust":
+            # A single in-memory frame gets exact quartiles
+            columns = self._init_columns(data)
+            values = data[columns].to_numpy(dtype=float)
+            with np.errstate(invalid="ignore"):
+                q1, median, q3 = np.nanquantile(values, [0.25, 0.5, 0.75], axis=0) if len(values) \
+                    else np.full((3, len(columns)), np.nan)
+            self.offset_, self.scale_ = median, q3 - q1
+            return self
+        for chunk in [data] if isinstance(data, pd.DataFrame) else data:
+            self.partial_fit(chunk)
+        return self
+
+    def partial_fit(self, df: pd.DataFrame) -> "Scaler":
+        """
+        Update the statistics with one more chunk.
+
+        Parameters:
+        - df: pd.DataFrame
+            The next chunk.
+
+        Returns:
+        - The updated Scaler
+        """
+        columns = self._init_columns(df)
+        values = df[columns].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+
+        if self.method == "z":
+            n = valid.sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.nansum(values, axis=0) / n
+                m2 = np.nansum((values - mean) ** 2, axis=0)
+            # Chan et al. merge of the chunk moments into the running moments
+            total = self.n_ + n
+            delta = np.where(n > 0, mean - self.mean_, 0.0)
+            share = np.divide(n, total, out=np.zeros(len(columns)), where=total > 0)
+            self.mean_ = self.mean_ + delta * share
+            self.m2_ = self.m2_ + np.where(n > 0, m2, 0.0) + delta ** 2 * self.n_ * share
+            self.n_ = total
+        elif self.method == "min_max":
+            with np.errstate(invalid="ignore"):
+                self.min_ = np.fmin(self.min_, np.nanmin(values, axis=0, initial=np.inf, where=valid))
+                self.max_ = np.fmax(self.max_, np.nanmax(values, axis=0, initial=-np.inf, where=valid))
+        elif self.method == "robust":
+            for i, col in enumerate(columns):
+                self.sketches_.setdefault(col, QuantileSketch(self.sketch_error)).update(values[:, i])
+        else:
+            # Like log_normalize, a column qualifies only if every value is > 0 (NaN disqualifies)
+            self.positive_ &= (values > 0).all(axis=0)
+        self._finalize()
+        return self
+
+    def transform(self, df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
+        """
+        Normalize df with the fitted statistics.
+
+        Parameters:
+        - df: pd.DataFrame
+            The DataFrame (or chunk) to normalize; it must contain the fitted columns.
+        - inplace: bool
+            If True, modify df itself. Otherwise only the changed columns are copied.
+
+        Returns:
+        - pd.DataFrame
+            A DataFrame with the fitted columns normalized.
+        """
+        if self.offset_ is None:
+            raise ValueError("The scaler is not fitted yet. Call fit first.")
+        if self.method == "log":
+            # Non-positive values in new data become NaN instead of -inf
+            columns = [col for col, positive in zip(self.columns, self.positive_) if positive]
+            return apply_transforms(df, [("log", columns)], inplace=inplace, domain="nan")
+        out = prepare_output(df, inplace)
+        if not self.columns:
+            return out
+        values = df[self.columns].to_numpy(dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = (values - self.offset_) / self.scale_
+        out[self.columns] = pd.DataFrame(values, index=df.index, columns=self.columns)
+        return out
+
+    def fit_transform(self, df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
+        """
+        Fit on df and normalize it.
+        """
+        return self.fit(df).transform(df, inplace=inplace)
+
+    def to_dict(self) -> dict:
+        """
+        Serializable (JSON-compatible) representation of the fitted scaler.
+        """
+        state = {"method": self.method, "columns": self.columns, "sketch_error": self.sketch_error}
+        for name in ("n_", "mean_", "m2_", "min_", "max_", "positive_", "offset_", "scale_"):
+            value = getattr(self, name)
+            state[name] = None if value is None else [None if pd.isna(v) else v.item() for v in value]
+        state["sketches_"] = {col: sketch.to_dict() for col, sketch in self.sketches_.items()}
+        return state
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "Scaler":
+        """
+        Restore a fitted scaler from to_dict output.
+        """
+        scaler = cls(state["method"], state.get("columns"), state.get("sketch_error", 0.005))
+        dtypes = {"n_": np.int64, "positive_": bool}
+        for name in ("n_", "mean_", "m2_", "min_", "max_", "positive_", "offset_", "scale_"):
+            value = state.get(name)
+            if value is not None:
+                value = np.array([np.nan if v is None else v for v in value], dtype=dtypes.get(name, float))
+            setattr(scaler, name, value)
+        scaler.sketches_ = {col: QuantileSketch.from_dict(s) for col, s in state.get("sketches_", {}).items()}
+        return scaler
+
+    def _reset(self):
+        self.n_ = self.mean_ = self.m2_ = self.min_ = self.max_ = self.positive_ = None
+        self.offset_ = self.scale_ = None
+        self.sketches_ = {}
+
+    def _init_columns(self, df: pd.DataFrame) -> list:
+        if self.columns is None:
+            self.columns = list(df.select_dtypes(include=[np.number]).columns)
+        if self.n_ is None:
+            k = len(self.columns)
+            self.n_ = np.zeros(k, dtype=np.int64)
+            self.mean_, self.m2_ = np.zeros(k), np.zeros(k)
+            self.min_, self.max_ = np.full(k, np.nan), np.full(k, np.nan)
+            self.positive_ = np.ones(k, dtype=bool)
+        return self.columns
+
+    def _finalize(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.method == "z":
+                # Sample standard deviation (ddof=1), like pandas' std
+                self.offset_ = np.where(self.n_ > 0, self.mean_, np.nan)
+                self.scale_ = np.sqrt(self.m2_ / (self.n_ - 1))
+            elif self.method == "min_max":
+                self.offset_, self.scale_ = self.min_, self.max_ - self.min_
+            elif self.method == "robust":
+                quartiles = np.array([self.sketches_[col].quantile([0.25, 0.5, 0.75]) for col in self.columns]).reshape(-1, 3)
+                self.offset_, self.scale_ = quartiles[:, 1], quartiles[:, 2] - quartiles[:, 0]
+            else:
+                self.offset_, self.scale_ = np.zeros(len(self.columns)), np.ones(len(self.columns))
+
+
+def z_normalize(df: pd.DataFrame, columns: list, inplace: bool = False) -> pd.DataFrame:
     """
     Standardizes specified columns in a DataFrame using z-score normalization.
 
@@ -10,19 +204,16 @@ def z_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
         The input DataFrame.
     - columns: list
         List of column names to be standardized.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
     - pd.DataFrame
         A DataFrame with the specified columns standardized.
     """
-    for col in columns:
-        if col in df.columns:
-            mean = df[col].mean()
-            std = df[col].std()
-            df[col] = (df[col] - mean) / std
-    return df
+    return Scaler("z", [col for col in columns if col in df.columns]).fit_transform(df, inplace=inplace)
 
-def min_max_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+def min_max_normalize(df: pd.DataFrame, columns: list, inplace: bool = False) -> pd.DataFrame:
     """
     Normalizes specified columns in a DataFrame using min-max normalization.
 
@@ -31,19 +222,16 @@ def min_max_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
         The input DataFrame.
     - columns: list
         List of column names to be normalized.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
     - pd.DataFrame
         A DataFrame with the specified columns normalized.
     """
-    for col in columns:
-        if col in df.columns:
-            min_val = df[col].min()
-            max_val = df[col].max()
-            df[col] = (df[col] - min_val) / (max_val - min_val)
-    return df
+    return Scaler("min_max", [col for col in columns if col in df.columns]).fit_transform(df, inplace=inplace)
 
-def robust_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+def robust_normalize(df: pd.DataFrame, columns: list, inplace: bool = False, sketches: dict = None) -> pd.DataFrame:
     """
     Normalizes specified columns in a DataFrame using robust normalization (median and IQR).
 
@@ -52,19 +240,31 @@ def robust_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
         The input DataFrame.
     - columns: list
         List of column names to be normalized.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
+    - sketches: dict, optional
+        Mapping of column name to QuantileSketch. The median and IQR of these columns come
+        from the sketch, so statistics built over all chunks can be applied to each chunk.
 
     Returns:
     - pd.DataFrame
         A DataFrame with the specified columns normalized.
     """
+    if not sketches:
+        return Scaler("robust", [col for col in columns if col in df.columns]).fit_transform(df, inplace=inplace)
+    out = prepare_output(df, inplace)
     for col in columns:
         if col in df.columns:
-            median = df[col].median()
-            iqr = df[col].quantile(0.75) - df[col].quantile(0.25)
-            df[col] = (df[col] - median) / iqr
-    return df
+            if col in sketches:
+                q1, median, q3 = sketches[col].quantile([0.25, 0.5, 0.75])
+                iqr = q3 - q1
+            else:
+                median = df[col].median()
+                iqr = df[col].quantile(0.75) - df[col].quantile(0.25)
+            out[col] = (df[col] - median) / iqr
+    return out
 
-def log_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+def log_normalize(df: pd.DataFrame, columns: list, inplace: bool = False) -> pd.DataFrame:
     """
     Applies log normalization to specified columns in a DataFrame.
 
@@ -73,17 +273,201 @@ def log_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
         The input DataFrame.
     - columns: list
         List of column names to be log normalized.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
     - pd.DataFrame
         A DataFrame with the specified columns log normalized.
     """
-    for col in columns:
-        if col in df.columns and (df[col] > 0).all():
-            df[col] = df[col].apply(lambda x: np.log(x))
-    return df
+    return Scaler("log", [col for col in columns if col in df.columns]).fit_transform(df, inplace=inplace)
+
+class QuantileNormalizer:
+    """
+    Quantile normalization of many columns to one shared reference distribution.
 
-def quantile_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    fit sorts all selected columns as one 2-D array and averages them into a
+    reference quantile function (columns with NaN are resampled to a common
+    grid first). transform maps every value to the reference at its column's
+    tie-averaged rank, so equal values always get equal results and NaN stays
+    NaN. With n_quantiles set, the engine is approximate: columns are
+    summarized by n_quantiles points of a QuantileSketch instead of being
+    fully sorted, ranks are interpolated between those points and the
+    reference has n_quantiles points; fit then also accepts an iterable of
+    chunks. The fitted reference can be reused on new data and persisted with
+    to_dict/from_dict.
+    """
+
+    def __init__(self, columns: list = None, n_quantiles: int = None, sketch_error: float = 0.001):
+        """
+        Parameters:
+        - columns: list, optional
+            Columns to normalize. If None, the numeric columns of the first fitted frame are used.
+        - n_quantiles: int, optional
+            Number of quantile points for the approximate mode. None sorts the columns exactly.
+        - sketch_error: float
+            Rank error of the quantile sketches used by the approximate mode.
+        """
+        if n_quantiles is not None and n_quantiles < 2:
+            raise ValueError("n_quantiles must be at least 2.")
+        self.columns = list(columns) if columns is not None else None
+        self.n_quantiles = n_quantiles
+        self.sketch_error = sketch_error
+        self.reference_ = None
+
+    def fit(self, data) -> "QuantileNormalizer":
+        """
+        Build the reference distribution.
+
+        Parameters:
+        - data: pd.DataFrame or iterable
+            A DataFrame, or (approximate mode only) an iterable of DataFrame chunks.
+
+        Returns:
+        - The fitted QuantileNormalizer
+        """
+        if self.n_quantiles is None:
+            if not isinstance(data, pd.DataFrame):
+                raise ValueError("Exact quantile normalization needs a DataFrame; set n_quantiles to fit on chunks.")
+            knots = self._sorted_columns(data)
+            size = max((len(k) for k in knots), default=0)
+        else:
+            knots = self._sketch_knots(data)
+            size = self.n_quantiles
+        knots = [k for k in knots if len(k)]
+        if not knots:
+            raise ValueError("No non-NaN values to build the reference distribution from.")
+        if all(len(k) == size for k in knots):
+            self.reference_ = np.mean(knots, axis=0)
+        else:
+            grid = np.linspace(0, 1, size)
+            self.reference_ = np.mean([np.interp(grid, np.linspace(0, 1, len(k)), k) for k in knots], axis=0)
+        return self
+
+    def transform(self, df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
+        """
+        Map the columns of df onto the fitted reference distribution.
+
+        Parameters:
+        - df: pd.DataFrame
+            The DataFrame to normalize; ranks are computed within df.
+        - inplace: bool
+            If True, modify df itself. Otherwise only the changed columns are copied.
+
+        Returns:
+        - pd.DataFrame
+            A DataFrame with the columns quantile normalized.
+        """
+        if self.reference_ is None:
+            raise ValueError("The normalizer is not fitted yet. Call fit first.")
+        out = prepare_output(df, inplace)
+        columns = [col for col in self.columns if col in df.columns]
+        if not columns:
+            return out
+        values = df[columns].to_numpy(dtype=float, copy=True)
+        knots = None if self.n_quantiles is None else self._sketch_knots(df, columns)
+        for i in range(len(columns)):
+            valid = ~np.isnan(values[:, i])
+            column = values[valid, i]
+            fraction = _average_rank_fraction(column) if knots is None else _mid_rank_fraction(knots[i], column)
+            values[valid, i] = _interp_uniform(self.reference_, fraction)
+        out[columns] = pd.DataFrame(values, index=df.index, columns=columns)
+        return out
+
+    def fit_transform(self, df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
+        """
+        Fit on df and normalize it.
+        """
+        return self.fit(df).transform(df, inplace=inplace)
+
+    def to_dict(self) -> dict:
+        """
+        Serializable (JSON-compatible) representation of the fitted reference.
+        """
+        return {"columns": self.columns, "n_quantiles": self.n_quantiles, "sketch_error": self.sketch_error,
+                "reference": None if self.reference_ is None else self.reference_.tolist()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "QuantileNormalizer":
+        """
+        Restore a fitted normalizer from to_dict output.
+        """
+        normalizer = cls(state.get("columns"), state.get("n_quantiles"), state.get("sketch_error", 0.001))
+        if state.get("reference") is not None:
+            normalizer.reference_ = np.asarray(state["reference"], dtype=float)
+        return normalizer
+
+    def _init_columns(self, df: pd.DataFrame) -> list:
+        if self.columns is None:
+            self.columns = list(df.select_dtypes(include=[np.number]).columns)
+        return self.columns
+
+    def _sorted_columns(self, df: pd.DataFrame, columns: list = None) -> list:
+        # One 2-D sort; NaN ends up at the bottom of each column and is cut off
+        columns = self._init_columns(df) if columns is None else columns
+        block = np.sort(df[columns].to_numpy(dtype=float), axis=0)
+        counts = (~np.isnan(block)).sum(axis=0)
+        return [block[:count, i] for i, count in enumerate(counts)]
+
+    def _sketch_knots(self, data, columns: list = None) -> list:
+        chunks = [data] if isinstance(data, pd.DataFrame) else data
+        sketches = None
+        for chunk in chunks:
+            if sketches is None:
+                columns = self._init_columns(chunk) if columns is None else columns
+                sketches = [QuantileSketch(self.sketch_error, seed=0) for _ in columns]
+            values = chunk[columns].to_numpy(dtype=float)
+            for i, sketch in enumerate(sketches):
+                sketch.update(values[:, i])
+        grid = np.linspace(0, 1, self.n_quantiles)
+        return [sketch.quantile(grid) if sketch.n else np.empty(0) for sketch in sketches or []]
+
+
+def _average_rank_fraction(values: np.ndarray) -> np.ndarray:
+    """
+    Tie-averaged rank of every value within values, as a fraction in [0, 1].
+    """
+    if len(values) < 2:
+        return np.full(len(values), 0.5)
+    order = np.argsort(values, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(values[order]) != 0])
+    counts = np.diff(np.r_[starts, len(values)])
+    ranks = np.empty(len(values))
+    ranks[order] = np.repeat(starts + (counts - 1) / 2, counts)
+    return ranks / (len(values) - 1)
+
+
+def _mid_rank_fraction(knots: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Position of values within sorted knots as a fraction in [0, 1]; values equal to a run
+    of knots get the middle of the run (tie-averaged rank), others are interpolated.
+    """
+    if len(knots) < 2:
+        return np.full(len(values), 0.5)
+    right = np.searchsorted(knots, values, side="right")
+    lower = np.clip(right - 1, 0, len(knots) - 2)
+    span = knots[lower + 1] - knots[lower]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        position = lower + np.clip(np.where(span > 0, (values - knots[lower]) / span, 0.0), 0, 1)
+    # Only values that hit a knot can be tied with a run of knots
+    hit = np.flatnonzero((right > 0) & (knots[np.maximum(right - 1, 0)] == values))
+    left = np.searchsorted(knots, values[hit], side="left")
+    position[hit] = (left + right[hit] - 1) / 2
+    return position / (len(knots) - 1)
+
+
+def _interp_uniform(reference: np.ndarray, fraction: np.ndarray) -> np.ndarray:
+    """
+    Linear interpolation of reference (sampled on a uniform grid over [0, 1]) at fraction.
+    """
+    position = fraction * (len(reference) - 1)
+    lower = np.minimum(position.astype(np.intp), max(len(reference) - 2, 0))
+    weight = position - lower
+    upper = np.minimum(lower + 1, len(reference) - 1)
+    return reference[lower] * (1 - weight) + reference[upper] * weight
+
+
+def quantile_normalize(df: pd.DataFrame, columns: list, inplace: bool = False, n_quantiles: int = None) -> pd.DataFrame:
     """
     Applies quantile normalization to specified columns in a DataFrame.
 
@@ -92,14 +476,16 @@ def quantile_normalize(df: pd.DataFrame, columns: list) -> pd.DataFrame:
         The input DataFrame.
     - columns: list
         List of column names to be quantile normalized.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
+    - n_quantiles: int, optional
+        Use the approximate engine with this many quantile points (see QuantileNormalizer).
 
     Returns:
     - pd.DataFrame
-        A DataFrame with the specified columns quantile normalized.
+        A DataFrame with the specified columns mapped onto their shared reference distribution.
     """
-    for col in columns:
-        if col in df.columns:
-            sorted_col = np.sort(df[col])
-            rank = np.argsort(np.argsort(df[col]))
-            df[col] = sorted_col[rank]
-    return df
+    columns = [col for col in columns if col in df.columns]
+    if not columns:
+        return prepare_output(df, inplace)
+    return QuantileNormalizer(columns, n_quantiles).fit_transform(df, inplace=inplace)
@@ -1,8 +1,16 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import zscore
+import os
+import joblib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from scipy.linalg import solve_triangular
+from scipy.stats import chi2
+from sklearn.covariance import MinCovDet
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
+from modules.processing.execution import prepare_output, drop_rows, fingerprint
 
 
 def detect_outliers_zscore(df: pd.DataFrame, column: str, threshold: float = 3.0) -> pd.DataFrame:
@@ -17,105 +25,478 @@ def detect_outliers_zscore(df: pd.DataFrame, column: str, threshold: float = 3.0
     Returns:
         pd.DataFrame: Rows where the column value is an outlier.
     """
-    z_scores = zscore(df[column].dropna())
-    outliers = df.loc[df[column].dropna().index[np.abs(z_scores) > threshold]]
-    return outliers
+    return df[detect_outliers(df, [column], method="zscore", threshold=threshold).rows()]
 
 
-def detect_outliers_iqr(df: pd.DataFrame, column: str) -> pd.DataFrame:
+def detect_outliers_iqr(df: pd.DataFrame, column: str, sketches: dict = None) -> pd.DataFrame:
     """
     Detect univariate outliers using IQR method.
 
     Parameters:
         df (pd.DataFrame): Input DataFrame.
         column (str): Column name to check.
+        sketches (dict, optional): Mapping of column name to QuantileSketch to take the quartiles from.
 
     Returns:
         pd.DataFrame: Rows where the column value is an outlier.
     """
-    Q1 = df[column].quantile(0.25)
-    Q3 = df[column].quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    outliers = df[(df[column] < lower_bound) | (df[column] > upper_bound)]
-    return outliers
+    return df[detect_outliers(df, [column], method="iqr", sketches=sketches).rows()]
 
 
-def detect_outliers_isolation_forest(df: pd.DataFrame, contamination: float = 0.01) -> pd.DataFrame:
+def detect_outliers_isolation_forest(df: pd.DataFrame, contamination: float = 0.01, sample_size: int = 100_000,
+                                     cache_dir: str = None) -> pd.DataFrame:
     """
     Detect multivariate outliers using Isolation Forest.
 
+    The fitted scaler and forest are cached (see fit_isolation_forest), so reruns
+    with the same data and a different contamination only rescore the rows.
+
     Parameters:
         df (pd.DataFrame): Input DataFrame with numeric columns.
         contamination (float): Proportion of expected outliers.
+        sample_size (int): Max number of rows the model is fitted on.
+        cache_dir (str, optional): Directory to persist the fitted model in, e.g. the project folder.
 
     Returns:
         pd.DataFrame: Rows detected as outliers.
     """
-    numeric_df = df.select_dtypes(include=[np.number])
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(numeric_df)
+    model = fit_isolation_forest(df, sample_size=sample_size, cache_dir=cache_dir)
+    scores = model.score(df)
+    return df[outliers_from_scores(scores, contamination)]
+
+
+def detect_outliers_mahalanobis(df: pd.DataFrame, columns: list = None, quantile: float = 0.975,
+                                sample_size: int = 5_000, random_state: int = 42) -> pd.DataFrame:
+    """
+    Detect multivariate outliers by their robust Mahalanobis distance.
+
+    Rows whose squared distance to the MCD location exceeds the chi-square quantile
+    (degrees of freedom = number of columns) are outliers. Rows with NaN are never flagged.
+
+    Parameters:
+        df (pd.DataFrame): Input DataFrame.
+        columns (list, optional): Columns to use. If None, all numeric columns are used.
+        quantile (float): Chi-square quantile used as cutoff.
+        sample_size (int): Max number of rows the robust covariance is fitted on.
+        random_state (int): Seed of the subsample and the MCD.
 
-    iso_forest = IsolationForest(contamination=contamination, random_state=42)
-    preds = iso_forest.fit_predict(scaled_data)
-    outliers = df[preds == -1]
-    return outliers
+    Returns:
+        pd.DataFrame: Rows detected as outliers.
+    """
+    model = MahalanobisModel(sample_size=sample_size, random_state=random_state).fit(df, columns)
+    return df[model.score(df) > model.cutoff(quantile)]
 
 
-def remove_outliers(df: pd.DataFrame, outliers: pd.DataFrame) -> pd.DataFrame:
+def remove_outliers(df: pd.DataFrame, outliers, inplace: bool = False) -> pd.DataFrame:
     """
     Remove rows identified as outliers.
 
     Parameters:
         df (pd.DataFrame): Original DataFrame.
-        outliers (pd.DataFrame): DataFrame containing outlier rows.
+        outliers (pd.DataFrame or OutlierMasks): DataFrame containing outlier rows, or the result of detect_outliers.
+        inplace (bool): If True, drop the rows from df itself.
 
     Returns:
         pd.DataFrame: Cleaned DataFrame without outliers.
     """
+    if isinstance(outliers, OutlierMasks):
+        keep = ~outliers.rows()
+        if inplace:
+            return drop_rows(df, keep)
+        return df[keep]
+    if inplace:
+        df.drop(outliers.index, inplace=True)
+        return df
     return df.drop(outliers.index)
 
 
-def cap_outliers_iqr(df: pd.DataFrame, column: str) -> pd.DataFrame:
+def cap_outliers_iqr(df: pd.DataFrame, column, inplace: bool = False, sketches: dict = None) -> pd.DataFrame:
     """
     Cap outliers in a column using the IQR method (Winsorization).
 
     Parameters:
         df (pd.DataFrame): Input DataFrame.
-        column (str): Column name to cap.
+        column (str or list): Column name (or names) to cap.
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
+        sketches (dict, optional): Mapping of column name to QuantileSketch to take the quartiles from,
+            e.g. built over all chunks with sketch_columns.
 
     Returns:
         pd.DataFrame: DataFrame with capped column values.
     """
-    Q1 = df[column].quantile(0.25)
-    Q3 = df[column].quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    df_copy = df.copy()
-    df_copy[column] = df_copy[column].clip(lower=lower_bound, upper=upper_bound)
-    return df_copy
+    columns = [column] if isinstance(column, str) else list(column)
+    return cap_outliers(df, detect_outliers(df, columns, method="iqr", sketches=sketches), inplace=inplace)
 
 
-def replace_outliers_with_median(df: pd.DataFrame, column: str) -> pd.DataFrame:
+def replace_outliers_with_median(df: pd.DataFrame, column, inplace: bool = False, sketches: dict = None) -> pd.DataFrame:
     """
     Replace outliers in a column with the median value using IQR method.
 
     Parameters:
         df (pd.DataFrame): Input DataFrame.
-        column (str): Column name to process.
+        column (str or list): Column name (or names) to process.
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
+        sketches (dict, optional): Mapping of column name to QuantileSketch to take the quartiles
+            and median from, e.g. built over all chunks with sketch_columns.
 
     Returns:
         pd.DataFrame: DataFrame with outliers replaced by the median.
     """
-    Q1 = df[column].quantile(0.25)
-    Q3 = df[column].quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    median = df[column].median()
-    df_copy = df.copy()
-    mask = (df_copy[column] < lower_bound) | (df_copy[column] > upper_bound)
-    df_copy.loc[mask, column] = median
-    return df_copy
+    columns = [column] if isinstance(column, str) else list(column)
+    return replace_outliers(df, detect_outliers(df, columns, method="iqr", sketches=sketches), inplace=inplace)
+
+
+@dataclass
+class OutlierMasks:
+    """
+    Result of detect_outliers: one boolean mask column and one pair of bounds per checked column.
+    """
+    columns: list
+    mask: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    median: np.ndarray
+
+    def rows(self) -> np.ndarray:
+        """
+        Boolean mask of rows that are an outlier in at least one column.
+        """
+        return self.mask.any(axis=1)
+
+    def bounds(self) -> pd.DataFrame:
+        """
+        Lower and upper bound (and median) per column.
+        """
+        return pd.DataFrame({"lower": self.lower, "upper": self.upper, "median": self.median}, index=self.columns)
+
+
+def detect_outliers(df: pd.DataFrame, columns: list = None, method: str = "iqr", threshold: float = None,
+                    sketches: dict = None) -> OutlierMasks:
+    """
+    Detect univariate outliers in many columns in one vectorized pass.
+
+    Parameters:
+        df (pd.DataFrame): Input DataFrame.
+        columns (list, optional): Columns to check. If None, all numeric columns are used.
+        method (str): 'iqr' (outside Q1 - t * IQR, Q3 + t * IQR) or 'zscore' (|z| > t, population std).
+        threshold (float, optional): t; defaults to 1.5 for 'iqr' and 3.0 for 'zscore'.
+        sketches (dict, optional): Mapping of column name to QuantileSketch. Quartiles and medians of
+            these columns come from the sketch instead of df, so bounds built over a whole chunked
+            dataset can be applied chunk by chunk.
+
+    Returns:
+        OutlierMasks: Boolean mask matrix (rows x columns), bounds and medians. NaN is never an outlier.
+    """
+    if method not in {"iqr", "zscore"}:
+        raise ValueError("Method must be 'iqr' or 'zscore'.")
+    if columns is None:
+        columns = df.select_dtypes(include=[np.number]).columns
+    columns = list(columns)
+    values = df[columns].to_numpy(dtype=float)
+
+    with np.errstate(invalid="ignore"):
+        if values.size:
+            q1, median, q3 = np.nanquantile(values, [0.25, 0.5, 0.75], axis=0)
+        else:
+            q1, median, q3 = np.full((3, len(columns)), np.nan)
+        for i, col in enumerate(columns):
+            if sketches and col in sketches:
+                q1[i], median[i], q3[i] = sketches[col].quantile([0.25, 0.5, 0.75])
+        if method == "iqr":
+            threshold = 1.5 if threshold is None else threshold
+            iqr = q3 - q1
+            lower, upper = q1 - threshold * iqr, q3 + threshold * iqr
+        else:
+            threshold = 3.0 if threshold is None else threshold
+            mean, std = np.nanmean(values, axis=0), np.nanstd(values, axis=0)
+            lower, upper = mean - threshold * std, mean + threshold * std
+        mask = (values < lower) | (values > upper)
+
+    return OutlierMasks(columns=columns, mask=mask, lower=lower, upper=upper, median=median)
+
+
+def cap_outliers(df: pd.DataFrame, outliers: OutlierMasks, inplace: bool = False) -> pd.DataFrame:
+    """
+    Cap the checked columns at the bounds of a detect_outliers result (Winsorization).
+
+    Parameters:
+        df (pd.DataFrame): Input DataFrame.
+        outliers (OutlierMasks): Result of detect_outliers on df.
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
+
+    Returns:
+        pd.DataFrame: DataFrame with capped column values.
+    """
+    values = df[outliers.columns].to_numpy(dtype=float)
+    return _write_columns(df, outliers, np.clip(values, outliers.lower, outliers.upper), inplace)
+
+
+def replace_outliers(df: pd.DataFrame, outliers: OutlierMasks, inplace: bool = False) -> pd.DataFrame:
+    """
+    Replace the outliers of a detect_outliers result with the column median.
+
+    Parameters:
+        df (pd.DataFrame): Input DataFrame.
+        outliers (OutlierMasks): Result of detect_outliers on df.
+        inplace (bool): If True, modify df itself. Otherwise only the changed columns are copied.
+
+    Returns:
+        pd.DataFrame: DataFrame with outliers replaced by the median.
+    """
+    values = df[outliers.columns].to_numpy(dtype=float)
+    return _write_columns(df, outliers, np.where(outliers.mask, outliers.median, values), inplace)
+
+
+def _write_columns(df: pd.DataFrame, outliers: OutlierMasks, values: np.ndarray, inplace: bool) -> pd.DataFrame:
+    """
+    Write the columns that contain outliers back in one assignment.
+    """
+    changed = np.flatnonzero(outliers.mask.any(axis=0))
+    out = prepare_output(df, inplace)
+    if len(changed):
+        columns = [outliers.columns[i] for i in changed]
+        out[columns] = pd.DataFrame(values[:, changed], index=df.index, columns=columns)
+    return out
+
+
+class IsolationForestModel:
+    """
+    Scaler plus Isolation Forest fitted once and reused for scoring.
+
+    fit trains on a random subsample of at most sample_size rows using all
+    cores; score returns an anomaly score per row (higher is more anomalous),
+    computed in parallel chunks. Since the contamination only sets a cutoff on
+    these scores (see outliers_from_scores), it can be changed without refitting.
+    The model can be stored with save and restored with load.
+    """
+
+    def __init__(self, n_estimators: int = 100, sample_size: int = 100_000, random_state: int = 42, n_jobs: int = -1):
+        """
+        Parameters:
+            n_estimators (int): Number of trees.
+            sample_size (int): Max number of rows to fit the scaler and the forest on.
+            random_state (int): Seed of the subsample and the forest.
+            n_jobs (int): Number of cores used to fit and score; -1 uses all cores.
+        """
+        self.n_estimators = n_estimators
+        self.sample_size = sample_size
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.columns_ = None
+        self.scaler_ = None
+        self.forest_ = None
+
+    def fit(self, df: pd.DataFrame, columns: list = None) -> "IsolationForestModel":
+        """
+        Fit the scaler and the forest on a subsample of df.
+
+        Parameters:
+            df (pd.DataFrame): Input DataFrame.
+            columns (list, optional): Columns to use. If None, all numeric columns are used.
+
+        Returns:
+            IsolationForestModel: The fitted model.
+        """
+        if columns is None:
+            columns = df.select_dtypes(include=[np.number]).columns
+        self.columns_ = list(columns)
+        values = df[self.columns_].to_numpy(dtype=float)
+        if len(values) > self.sample_size:
+            rows = np.random.default_rng(self.random_state).choice(len(values), self.sample_size, replace=False)
+            values = values[np.sort(rows)]
+        self.scaler_ = StandardScaler().fit(values)
+        self.forest_ = IsolationForest(n_estimators=self.n_estimators, random_state=self.random_state,
+                                       n_jobs=self.n_jobs).fit(self.scaler_.transform(values))
+        return self
+
+    def score(self, df: pd.DataFrame, chunksize: int = 50_000) -> pd.Series:
+        """
+        Anomaly score of every row of df; higher scores are more anomalous.
+
+        Parameters:
+            df (pd.DataFrame): DataFrame with the columns the model was fitted on.
+            chunksize (int): Number of rows scored per task.
+
+        Returns:
+            pd.Series: Scores with the index of df.
+        """
+        if self.forest_ is None:
+            raise ValueError("The model is not fitted yet. Call fit first.")
+        values = df[self.columns_].to_numpy(dtype=float)
+        chunks = [values[start:start + chunksize] for start in range(0, len(values), chunksize)]
+
+        def score_chunk(chunk):
+            return -self.forest_.score_samples(self.scaler_.transform(chunk))
+
+        n_jobs = None if self.n_jobs == -1 else self.n_jobs
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            scores = list(pool.map(score_chunk, chunks))
+        scores = np.concatenate(scores) if scores else np.empty(0)
+        return pd.Series(scores, index=df.index, name="Outlier_Score")
+
+    def save(self, path: str) -> None:
+        """
+        Persist the fitted model to path.
+        """
+        joblib.dump(self, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IsolationForestModel":
+        """
+        Restore a model stored with save.
+        """
+        return joblib.load(path)
+
+
+class MahalanobisModel:
+    """
+    Robust (MCD) location and covariance fitted on a subsample, used to score rows.
+
+    For low-dimensional numeric blocks this is much cheaper than an Isolation
+    Forest and catches rows that break the correlation structure without being
+    extreme in any single column. score returns the squared Mahalanobis distance
+    of every row, computed in vectorized blocks through the Cholesky factor of
+    the covariance; under normality it follows a chi-square distribution, which
+    gives the cutoff. Scores can also be cut with outliers_from_scores.
+    """
+
+    def __init__(self, sample_size: int = 5_000, support_fraction: float = None, random_state: int = 42):
+        """
+        Parameters:
+            sample_size (int): Max number of rows to fit the robust covariance on.
+            support_fraction (float, optional): Share of the subsample the MCD estimate is based on;
+                None uses the MCD default (n + p + 1) / 2.
+            random_state (int): Seed of the subsample and the MCD.
+        """
+        self.sample_size = sample_size
+        self.support_fraction = support_fraction
+        self.random_state = random_state
+        self.columns_ = None
+        self.location_ = None
+        self.covariance_ = None
+        self._cholesky = None
+
+    def fit(self, df: pd.DataFrame, columns: list = None) -> "MahalanobisModel":
+        """
+        Fit the MCD estimate on a subsample of the complete rows of df.
+
+        Parameters:
+            df (pd.DataFrame): Input DataFrame.
+            columns (list, optional): Columns to use. If None, all numeric columns are used.
+
+        Returns:
+            MahalanobisModel: The fitted model.
+        """
+        if columns is None:
+            columns = df.select_dtypes(include=[np.number]).columns
+        self.columns_ = list(columns)
+        values = df[self.columns_].to_numpy(dtype=float)
+        values = values[~np.isnan(values).any(axis=1)]
+        if len(values) <= len(self.columns_):
+            raise ValueError("Not enough complete rows to estimate the covariance.")
+        if len(values) > self.sample_size:
+            rows = np.random.default_rng(self.random_state).choice(len(values), self.sample_size, replace=False)
+            values = values[rows]
+        mcd = MinCovDet(support_fraction=self.support_fraction, random_state=self.random_state).fit(values)
+        self.location_ = mcd.location_
+        self.covariance_ = mcd.covariance_
+        self._cholesky = np.linalg.cholesky(self.covariance_)
+        return self
+
+    def score(self, df: pd.DataFrame, chunksize: int = 100_000) -> pd.Series:
+        """
+        Squared robust Mahalanobis distance of every row of df; NaN for incomplete rows.
+
+        Parameters:
+            df (pd.DataFrame): DataFrame with the columns the model was fitted on.
+            chunksize (int): Number of rows processed per block.
+
+        Returns:
+            pd.Series: Scores with the index of df.
+        """
+        if self._cholesky is None:
+            raise ValueError("The model is not fitted yet. Call fit first.")
+        values = df[self.columns_].to_numpy(dtype=float)
+        scores = np.empty(len(values))
+        for start in range(0, len(values), chunksize):
+            centered = values[start:start + chunksize] - self.location_
+            # d^2 = |L^-1 (x - mu)|^2 with covariance = L L^T
+            whitened = solve_triangular(self._cholesky, centered.T, lower=True, check_finite=False)
+            scores[start:start + chunksize] = np.einsum("ij,ij->j", whitened, whitened)
+        return pd.Series(scores, index=df.index, name="Outlier_Score")
+
+    def cutoff(self, quantile: float = 0.975) -> float:
+        """
+        Chi-square cutoff on the scores for the given quantile.
+        """
+        return chi2.ppf(quantile, df=len(self.columns_))
+
+
+def fit_isolation_forest(df: pd.DataFrame, columns: list = None, n_estimators: int = 100, sample_size: int = 100_000,
+                         random_state: int = 42, n_jobs: int = -1, cache_dir: str = None) -> IsolationForestModel:
+    """
+    Fit an IsolationForestModel, or reuse one fitted on the same data with the same parameters.
+
+    Models are cached in memory by a fingerprint of the data and the parameters. With
+    cache_dir they are also stored there (e.g. next to the project), so a later session
+    loads the model instead of refitting it.
+
+    Parameters:
+        df (pd.DataFrame): Input DataFrame.
+        columns (list, optional): Columns to use. If None, all numeric columns are used.
+        n_estimators (int): Number of trees.
+        sample_size (int): Max number of rows to fit on.
+        random_state (int): Seed of the subsample and the forest.
+        n_jobs (int): Number of cores; -1 uses all cores.
+        cache_dir (str, optional): Directory to persist fitted models in.
+
+    Returns:
+        IsolationForestModel: The fitted model.
+    """
+    if columns is None:
+        columns = df.select_dtypes(include=[np.number]).columns
+    columns = list(columns)
+    key = fingerprint(df[columns], ("isolation_forest", columns, n_estimators, sample_size, random_state))
+    if key in _MODEL_CACHE:
+        _MODEL_CACHE.move_to_end(key)
+        return _MODEL_CACHE[key]
+
+    path = os.path.join(cache_dir, f"isolation_forest_{key}.joblib") if cache_dir else None
+    if path and os.path.exists(path):
+        model = IsolationForestModel.load(path)
+    else:
+        model = IsolationForestModel(n_estimators, sample_size, random_state, n_jobs).fit(df, columns)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            model.save(path)
+
+    _MODEL_CACHE[key] = model
+    if len(_MODEL_CACHE) > _MODEL_CACHE_SIZE:
+        _MODEL_CACHE.popitem(last=False)
+    return model
+
+
+def outliers_from_scores(scores: pd.Series, contamination: float) -> pd.Series:
+    """
+    Flag the contamination share of rows with the highest anomaly scores.
+
+    Rows with a NaN score (e.g. missing values in MahalanobisModel.score) are
+    left out of the quantile and never flagged.
+
+    Parameters:
+        scores (pd.Series): Anomaly scores, e.g. from IsolationForestModel.score.
+        contamination (float): Proportion of expected outliers.
+
+    Returns:
+        pd.Series: Boolean mask with the index of scores.
+    """
+    if not 0 < contamination <= 0.5:
+        raise ValueError("contamination must be in (0, 0.5].")
+    values = scores.to_numpy(dtype=float)
+    if np.isnan(values).all():
+        return pd.Series(False, index=scores.index)
+    return scores > np.nanquantile(values, 1 - contamination)
+
+
+_MODEL_CACHE = OrderedDict()
+_MODEL_CACHE_SIZE = 8
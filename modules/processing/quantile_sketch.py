@@ -0,0 +1,188 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """
+    Mergeable KLL quantile sketch of one numeric column.
+
+    The sketch keeps a few hundred weighted samples in a stack of compactors;
+    whenever a level overflows, it is sorted and every other item is promoted
+    to the next level with double the weight. Memory stays O(1/error) no matter
+    how many values are added, sketches of separate chunks can be merged, and
+    any quantile can be answered with a rank error of about `error` (i.e. the
+    returned value lies between the true (q - error) and (q + error) quantiles
+    with high probability). NaN values are ignored; min and max are exact.
+    """
+
+    def __init__(self, error: float = 0.005, seed: int = None):
+        """
+        Parameters:
+            error (float): Target rank error, between 0 and 0.5. Smaller values keep more samples.
+            seed (int, optional): Seed of the compaction coin flips, for reproducible sketches.
+        """
+        if not 0 < error < 0.5:
+            raise ValueError("error must be between 0 and 0.5.")
+        self.error = error
+        self.k = max(8, int(math.ceil(3 / error)))
+        self.n = 0
+        self.min = np.nan
+        self.max = np.nan
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values) -> "QuantileSketch":
+        """
+        Add a batch of values (array-like or Series) to the sketch.
+
+        Parameters:
+            values (array-like): New values; NaN values are skipped.
+
+        Returns:
+            QuantileSketch: The updated sketch.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.n += len(values)
+        self.min = np.fmin(self.min, values.min())
+        self.max = np.fmax(self.max, values.max())
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """
+        Fold another sketch (e.g. of a different chunk) into this one.
+
+        Parameters:
+            other (QuantileSketch): Sketch to merge; it is left unchanged.
+
+        Returns:
+            QuantileSketch: The merged sketch.
+        """
+        if not other.n:
+            return self
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for h, items in enumerate(other._levels):
+            self._levels[h] = np.concatenate([self._levels[h], items])
+        self.n += other.n
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.error = max(self.error, other.error)
+        self.k = min(self.k, other.k)
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """
+        Approximate quantile(s) of all values added so far.
+
+        Parameters:
+            q (float or array-like): Quantile(s) between 0 and 1.
+
+        Returns:
+            float or np.ndarray: The quantile value(s); NaN for an empty sketch.
+        """
+        q_arr = np.atleast_1d(np.asarray(q, dtype=float))
+        if not self.n:
+            result = np.full(len(q_arr), np.nan)
+        else:
+            items = np.concatenate(self._levels)
+            weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self._levels)])
+            order = np.argsort(items, kind="stable")
+            items, cum = items[order], np.cumsum(weights[order])
+            pos = np.searchsorted(cum, q_arr * cum[-1], side="left")
+            result = items[np.minimum(pos, len(items) - 1)]
+            # The extremes are tracked exactly
+            result = np.where(q_arr <= 0, self.min, np.where(q_arr >= 1, self.max, result))
+        return result if np.ndim(q) else float(result[0])
+
+    def median(self) -> float:
+        """
+        Approximate median of all values added so far.
+        """
+        return self.quantile(0.5)
+
+    def to_dict(self) -> dict:
+        """
+        Serialize the sketch to plain Python types.
+
+        Returns:
+            dict: State that from_dict restores.
+        """
+        return {"error": self.error, "k": self.k, "n": self.n,
+                "min": None if np.isnan(self.min) else float(self.min),
+                "max": None if np.isnan(self.max) else float(self.max),
+                "levels": [level.tolist() for level in self._levels]}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "QuantileSketch":
+        """
+        Restore a sketch serialized with to_dict.
+
+        Parameters:
+            state (dict): Output of to_dict.
+
+        Returns:
+            QuantileSketch: The restored sketch.
+        """
+        sketch = cls(error=state["error"])
+        sketch.k = state["k"]
+        sketch.n = state["n"]
+        sketch.min = np.nan if state["min"] is None else state["min"]
+        sketch.max = np.nan if state["max"] is None else state["max"]
+        sketch._levels = [np.asarray(level, dtype=float) for level in state["levels"]]
+        return sketch
+
+    def _capacity(self, h: int) -> int:
+        # Lower levels get geometrically smaller buffers (factor 2/3), as in KLL
+        depth = len(self._levels) - 1 - h
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        h = 0
+        while h < len(self._levels):
+            level = self._levels[h]
+            if len(level) > self._capacity(h):
+                if h + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                level = np.sort(level)
+                # An odd item out stays on this level so no weight is lost
+                keep = level[-1:] if len(level) % 2 else level[:0]
+                pairs = level[:len(level) - len(keep)]
+                promoted = pairs[self._rng.integers(2)::2]
+                self._levels[h] = keep
+                self._levels[h + 1] = np.concatenate([self._levels[h + 1], promoted])
+            h += 1
+
+
+def sketch_columns(chunks, columns: list = None, error: float = 0.005, seed: int = None) -> dict:
+    """
+    Build one QuantileSketch per column in a single pass over chunked data.
+
+    Parameters:
+        chunks (pd.DataFrame or iterable): A DataFrame or an iterable of DataFrame chunks,
+            e.g. pd.read_csv(..., chunksize=...).
+        columns (list, optional): Columns to sketch. If None, the numeric columns of the first chunk are used.
+        error (float): Target rank error of every sketch.
+        seed (int, optional): Seed for reproducible sketches.
+
+    Returns:
+        dict: Mapping of column name to QuantileSketch.
+    """
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    sketches = None
+    for chunk in chunks:
+        if sketches is None:
+            if columns is None:
+                columns = chunk.select_dtypes(include=[np.number]).columns
+            sketches = {col: QuantileSketch(error=error, seed=seed) for col in columns}
+        for col, sketch in sketches.items():
+            sketch.update(chunk[col].to_numpy(dtype=float))
+    return sketches or {}
@@ -1,10 +1,16 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 from typing import Dict, Union, List
+from modules.processing.execution import prepare_output
 
 
 def apply_column_name_mapping(
     df: pd.DataFrame,
-    mapping: Union[Dict[str, str], pd.DataFrame]
+    mapping: Union[Dict[str, str], pd.DataFrame],
+    inplace: bool = False
 ) -> pd.DataFrame:
     """
     Rename columns in a DataFrame using a mapping dictionary or a 2-column DataFrame.
@@ -14,6 +20,8 @@ def apply_column_name_mapping(
           The input DataFrame to be renamed.  
       - mapping: Union[Dict[str, str], pd.DataFrame]  
           Either a dictionary or a 2-column DataFrame mapping original to target column names.
+      - inplace: bool  
+          If True, rename df itself. Otherwise the column data is shared with df.
 
     Returns:
       - pd.DataFrame  
@@ -26,17 +34,27 @@ def apply_column_name_mapping(
     else:
         mapping_dict = mapping
 
-    return df.rename(columns=mapping_dict)
+    out = prepare_output(df, inplace)
+    out.rename(columns=mapping_dict, inplace=True)
+    return out
 
 
 def apply_value_mapping(
     df: pd.DataFrame,
     value_mappings: Union[Dict[str, Dict], pd.DataFrame],
-    columns: List[str] = None
-) -> pd.DataFrame:
+    columns: List[str] = None,
+    inplace: bool = False,
+    as_categorical: bool = True,
+    return_report: bool = False
+):
     """
     Map values in categorical columns using a dictionary or a 2-column DataFrame.
 
+    Each target column is factorized once and the mapping is applied to its distinct
+    values only, so the cost depends on the number of categories rather than rows.
+    Mappings are compiled once and cached (see compile_value_mapping). Values without
+    a mapping become NaN, like Series.map.
+
     Parameters:
       - df: pd.DataFrame  
           The DataFrame with values to map.  
@@ -44,22 +62,124 @@ def apply_value_mapping(
           Dictionary of column-wise mappings or a 2-column DataFrame for flat mappings.  
       - columns: List[str]  
           Optional. List of columns to restrict value mapping to (used when passing flat 2-col DataFrame).
+      - inplace: bool  
+          If True, modify df itself. Otherwise only the changed columns are copied.
+      - as_categorical: bool  
+          If True, mapped columns are returned as pd.Categorical. Otherwise they get the dtype Series.map would give.
+      - return_report: bool  
+          If True, also return a DataFrame of the values that had no mapping.
 
     Returns:
       - pd.DataFrame  
           DataFrame with values mapped.
+      - pd.DataFrame (only if return_report)  
+          Columns 'Column', 'Value' and 'Count' (rows holding the value), one row per unmapped value.
     """
     if isinstance(value_mappings, pd.DataFrame):
         if value_mappings.shape[1] != 2:
             raise ValueError("Mapping DataFrame must have exactly 2 columns")
         if columns is None:
             raise ValueError("When using a 2-column DataFrame, you must specify the target columns")
-        for col in columns:
-            map_dict = dict(zip(value_mappings.iloc[:, 0], value_mappings.iloc[:, 1]))
-            df[col] = df[col].map(map_dict)
+        compiled = compile_value_mapping(value_mappings)
+        targets = {col: compiled for col in columns}
     else:
-        for col, mapping in value_mappings.items():
-            if col in df.columns:
-                df[col] = df[col].map(mapping)
+        targets = {col: compile_value_mapping(mapping) for col, mapping in value_mappings.items() if col in df.columns}
+
+    out = prepare_output(df, inplace)
+    unmapped = []
+    for col, compiled in targets.items():
+        out[col], missing = compiled.apply(df[col], as_categorical)
+        unmapped.extend({"Column": col, "Value": value, "Count": count} for value, count in missing.items())
+
+    if return_report:
+        return out, pd.DataFrame(unmapped, columns=["Column", "Value", "Count"])
+    return out
+
+
+class CompiledMapping:
+    """
+    Value mapping compiled to a lookup index plus an array of target values.
+    """
+
+    def __init__(self, keys: pd.Index, values: np.ndarray):
+        """
+        Parameters:
+          - keys: pd.Index  
+              Unique source values.
+          - values: np.ndarray  
+              Target value for every key.
+        """
+        self.keys = keys
+        self.values = values
+
+    def apply(self, series: pd.Series, as_categorical: bool = True) -> tuple:
+        """
+        Map a Series through the compiled table at the category level.
+
+        Parameters:
+          - series: pd.Series  
+              Values to map.
+          - as_categorical: bool  
+              Return a pd.Categorical instead of a plain array.
+
+        Returns:
+          - Tuple (mapped values, pd.Series of row counts per unmapped non-NaN value)
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, uniques = pd.factorize(series)
+        positions = self.keys.get_indexer(uniques)
+
+        # Map the distinct values, then re-densify the mapped values to categories
+        mapped = pd.api.extensions.take(self.values, positions, allow_fill=True)
+        mapped_codes, categories = pd.factorize(mapped)
+        # All-NaN or empty input has no uniques, so there is nothing to index
+        row_codes = np.where(codes >= 0, mapped_codes[np.maximum(codes, 0)] if len(uniques) else -1, -1)
+
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        missing = (positions == -1) & (counts > 0)
+        report = pd.Series(counts[missing], index=uniques[missing], dtype=np.int64)
+
+        if as_categorical:
+            values = pd.Categorical.from_codes(row_codes, categories=categories)
+        else:
+            values = pd.api.extensions.take(np.asarray(categories), row_codes, allow_fill=True)
+        return pd.Series(values, index=series.index, name=series.name), report
+
+
+def compile_value_mapping(mapping: Union[Dict, pd.DataFrame]) -> CompiledMapping:
+    """
+    Compile a value mapping (dict or 2-column DataFrame) into a CompiledMapping.
+
+    Compiled mappings are cached by a hash of their content, so the same mapping used for
+    several columns, reruns or projects is only compiled once.
+
+    Parameters:
+      - mapping: Union[Dict, pd.DataFrame]  
+          Source value to target value, as a dict or a 2-column DataFrame.
+
+    Returns:
+      - CompiledMapping
+    """
+    if isinstance(mapping, pd.DataFrame):
+        keys, values = mapping.iloc[:, 0].tolist(), mapping.iloc[:, 1].tolist()
+    else:
+        keys, values = list(mapping.keys()), list(mapping.values())
+    digest = hashlib.sha1(repr((keys, values)).encode()).hexdigest()
+    if digest in _MAPPING_CACHE:
+        _MAPPING_CACHE.move_to_end(digest)
+        return _MAPPING_CACHE[digest]
+
+    # Later duplicates win, as in dict(zip(...))
+    table = pd.Series(values, index=pd.Index(keys, dtype=object))
+    table = table[~table.index.duplicated(keep="last")]
+    compiled = CompiledMapping(pd.Index(table.index), table.to_numpy())
+    _MAPPING_CACHE[digest] = compiled
+    if len(_MAPPING_CACHE) > _MAPPING_CACHE_SIZE:
+        _MAPPING_CACHE.popitem(last=False)
+    return compiled
+
 
-    return df
+_MAPPING_CACHE = OrderedDict()
+_MAPPING_CACHE_SIZE = 128
@@ -1,6 +1,108 @@
 import pandas as pd
+import numpy as np
+from modules.processing.execution import prepare_output
 
-def absolute_transform(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+# name -> (ufunc, domain check, keeps integer dtypes)
+TRANSFORMS = {
+    "abs": (np.abs, None, True),
+    "square": (np.square, None, True),
+    "sqrt": (np.sqrt, lambda x: x >= 0, False),
+    "log": (np.log, lambda x: x > 0, False),
+    "log1p": (np.log1p, lambda x: x > -1, False),
+    "reciprocal": (lambda x: np.divide(1.0, x), lambda x: x != 0, False),
+}
+DOMAIN_POLICIES = ("skip", "nan", "raise")
+
+def apply_transforms(df: pd.DataFrame, transforms: list, inplace: bool = False, domain: str = "skip") -> pd.DataFrame:
+    """
+    Applies a list of elementwise transforms to many columns in one pass.
+
+    All referenced columns are read into one 2-D block, each transform runs as a
+    single NumPy ufunc over its column slice of the block (several transforms on
+    the same column are chained in order), and the changed columns are written
+    back with one assignment. Integer columns keep their dtype when only 'abs'
+    and 'square' are applied to them. Nullable columns (Int64, Float64, ...) are
+    transformed as float64 and keep a nullable dtype.
+
+    Parameters:
+    - df: pd.DataFrame
+        The input DataFrame.
+    - transforms: list
+        List of (name, columns) pairs, applied in order. Names are the keys of TRANSFORMS
+        ('abs', 'square', 'sqrt', 'log', 'log1p', 'reciprocal').
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
+    - domain: str
+        What to do with values outside a transform's domain (negatives for 'sqrt', zeros and
+        negatives for 'log', ...):
+        'skip' leaves the column unchanged if any value is out of domain or NaN (the behaviour of
+        the single-transform helpers), 'nan' turns out-of-domain values into NaN and 'raise' raises
+        a ValueError. NaN values always stay NaN.
+
+    Returns:
+    - pd.DataFrame
+        A DataFrame with the transformed columns.
+    """
+    if domain not in DOMAIN_POLICIES:
+        raise ValueError(f"Unknown domain policy: {domain}. Use one of {DOMAIN_POLICIES}.")
+    steps = []
+    for name, columns in transforms:
+        if name not in TRANSFORMS:
+            raise ValueError(f"Unknown transform: {name}. Use one of {tuple(TRANSFORMS)}.")
+        steps.append((name, [col for col in ([columns] if isinstance(columns, str) else columns) if col in df.columns]))
+
+    out = prepare_output(df, inplace)
+    columns = list(dict.fromkeys(col for _, cols in steps for col in cols))
+    if not columns:
+        return out
+    position = {col: i for i, col in enumerate(columns)}
+    keeps_int = {col: True for col in columns}
+    for name, cols in steps:
+        for col in cols:
+            keeps_int[col] &= TRANSFORMS[name][2]
+    # Nullable (extension) columns such as Int64 and Float64 are processed as float64 with NA as NaN
+    extension = {col for col in columns if pd.api.types.is_extension_array_dtype(df[col].dtype)}
+    dtypes = [np.float64 if col in extension else df[col].dtype for col in columns]
+    block_dtype = np.result_type(*dtypes, *([] if all(keeps_int.values()) else [np.float64]))
+    if extension:
+        block = df[columns].to_numpy(dtype=block_dtype, na_value=np.nan, copy=True)
+    else:
+        block = df[columns].to_numpy(dtype=block_dtype, copy=True)
+    changed = np.zeros(len(columns), dtype=bool)
+
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        for name, cols in steps:
+            if not cols:
+                continue
+            func, in_domain, _ = TRANSFORMS[name]
+            idx = np.array([position[col] for col in cols])
+            values = block[:, idx]
+            if in_domain is not None:
+                valid = in_domain(values)
+                if domain == "skip":
+                    ok = valid.all(axis=0)
+                    idx, values = idx[ok], values[:, ok]
+                else:
+                    bad = ~valid & ~np.isnan(values)
+                    if domain == "raise" and bad.any():
+                        bad_cols = [cols[i] for i in np.flatnonzero(bad.any(axis=0))]
+                        raise ValueError(f"Values outside the domain of '{name}' in columns: {bad_cols}")
+                    values = np.where(bad, np.nan, values)
+            block[:, idx] = func(values)
+            changed[idx] = True
+
+    written = [col for col, c in zip(columns, changed) if c]
+    if written:
+        result = pd.DataFrame(block[:, changed], index=df.index, columns=written)
+        restore = {col: df[col].dtype for col in written if keeps_int[col] and df[col].dtype != result[col].dtype}
+        # Nullable columns stay nullable; integer ones become Float64 if a transform made them float
+        restore.update({col: df[col].dtype if keeps_int[col] or df[col].dtype.kind == "f" else pd.Float64Dtype()
+                        for col in written if col in extension})
+        out[written] = result.astype(restore) if restore else result
+    return out
+
+
+def absolute_transform(df: pd.DataFrame, columns: list, inplace: bool = False) -> pd.DataFrame:
     """
     Applies absolute transformation to specified columns in a DataFrame.
 
@@ -9,17 +111,16 @@ def absolute_transform(df: pd.DataFrame, columns: list) -> pd.DataFrame:
         The input DataFrame.
     - columns: list
         List of column names to be transformed.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
     - pd.DataFrame
         A DataFrame with the specified columns transformed to their absolute values.
     """
-    for col in columns:
-        if col in df.columns:
-            df[col] = df[col].abs()
-    return df
+    return apply_transforms(df, [("abs", columns)], inplace=inplace)
 
-def square_transform(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+def square_transform(df: pd.DataFrame, columns: list, inplace: bool = False) -> pd.DataFrame:
     """
     Applies square transformation to specified columns in a DataFrame.
 
@@ -28,17 +129,16 @@ def square_transform(df: pd.DataFrame, columns: list) -> pd.DataFrame:
         The input DataFrame.
     - columns: list
         List of column names to be transformed.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
     - pd.DataFrame
         A DataFrame with the specified columns transformed by squaring their values.
     """
-    for col in columns:
-        if col in df.columns:
-            df[col] = df[col] ** 2
-    return df
+    return apply_transforms(df, [("square", columns)], inplace=inplace)
 
-def square_root_transform(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+def square_root_transform(df: pd.DataFrame, columns: list, inplace: bool = False) -> pd.DataFrame:
     """
     Applies square root transformation to specified columns in a DataFrame.
 
@@ -47,12 +147,11 @@ def square_root_transform(df: pd.DataFrame, columns: list) -> pd.DataFrame:
         The input DataFrame.
     - columns: list
         List of column names to be transformed.
+    - inplace: bool
+        If True, modify df itself. Otherwise only the changed columns are copied.
 
     Returns:
     - pd.DataFrame
         A DataFrame with the specified columns transformed by taking their square roots.
     """
-    for col in columns:
-        if col in df.columns and (df[col] >= 0).all():
-            df[col] = df[col].apply(lambda x: x**0.5 if x >= 0 else None)
-    return df
\ No newline at end of file
+    return apply_transforms(df, [("sqrt", columns)], inplace=inplace)
\ No newline at end of file
@@ -1,8 +1,15 @@
 import pandas as pd
 import numpy as np
+from scipy import sparse
 import warnings
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from modules.processing.execution import prepare_output
 
-def rake_weights(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata: list, max_iter:int=20, tol:float=1e-6) -> pd.Series:
+_MAX_KEY_SPAN = 2 ** 62
+
+def rake_weights(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata: list, max_iter:int=20, tol:float=1e-6, return_trace:bool=False, inplace:bool=False) -> pd.Series:
     """
     Rakes sample_df to match the unweighted marginal distributions in target_df.
 
@@ -10,20 +17,23 @@ def rake_weights(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata: list,
     - sample_df: DataFrame to reweight
     - target_df: Target population DataFrame (unweighted)
     - strata: List of column names to rake on (in order)
-    - max_iter: Max iterations per variable
-    - tol: Convergence tolerance
+    - max_iter: Max number of sweeps over all strata
+    - tol: Convergence tolerance on the largest marginal residual
+    - return_trace: If True, also return the per-sweep residual trace
+    - inplace: If True, add the column to sample_df itself instead of a shallow copy
 
     Returns:
     - Dataframe with a new column "Rake_Weights" containing the calculated weights.
+      If return_trace is True, a tuple (DataFrame, trace) is returned instead.
     """
 
     target_marginals = [
         target_df[col].value_counts(normalize=True) for col in strata
     ]
 
-    return _rake(sample_df, strata, target_marginals, max_iter=max_iter, tol=tol)
+    return _rake(sample_df, strata, target_marginals, max_iter=max_iter, tol=tol, return_trace=return_trace, inplace=inplace)
 
-def rake_weights_weighted(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata:list, weight_col:str, max_iter:int=20, tol:float=1e-6) -> pd.Series:
+def rake_weights_weighted(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata:list, weight_col:str, max_iter:int=20, tol:float=1e-6, return_trace:bool=False, inplace:bool=False) -> pd.Series:
     """
     Rakes sample_df to match weighted marginal distributions derived from aggregated census data.
 
@@ -32,21 +42,24 @@ def rake_weights_weighted(sample_df: pd.DataFrame, target_df: pd.DataFrame, stra
     - target_df: Target population DataFrame with one row per unique combination of variables
     - strata: List of column names to rake on (in order)
     - weight_col: Column in target_df_joint with counts for each combination
-    - max_iter: Max iterations per variable
-    - tol: Convergence tolerance
+    - max_iter: Max number of sweeps over all strata
+    - tol: Convergence tolerance on the largest marginal residual
+    - return_trace: If True, also return the per-sweep residual trace
+    - inplace: If True, add the column to sample_df itself instead of a shallow copy
 
     Returns:
     - Dataframe with a new column "Rake_Weights" containing the calculated weights.
+      If return_trace is True, a tuple (DataFrame, trace) is returned instead.
     """
     target_marginals = [
         target_df.groupby(col)[weight_col].sum() / target_df[weight_col].sum()
         for col in strata
     ]
     
-    return _rake(sample_df, strata, target_marginals, max_iter=max_iter, tol=tol)
+    return _rake(sample_df, strata, target_marginals, max_iter=max_iter, tol=tol, return_trace=return_trace, inplace=inplace)
 
 
-def _rake(sample_df: pd.DataFrame, strata: pd.DataFrame, target_marginals: list, max_iter:int, tol:float) -> pd.Series:
+def _rake(sample_df: pd.DataFrame, strata: list, target_marginals: list, max_iter:int, tol:float, return_trace:bool=False, inplace:bool=False) -> pd.Series:
     """
     Shared raking logic. Matches sample_df marginals to the given target distributions.
 
@@ -54,35 +67,495 @@ def _rake(sample_df: pd.DataFrame, strata: pd.DataFrame, target_marginals: list,
     - sample_df: DataFrame to reweight
     - strata: Columns to rake on (in order)
     - target_marginals: List of Series of target proportions (one per column)
-    - max_iter: Max iterations per column
-    - tol: Convergence tolerance
+    - max_iter: Max number of sweeps over all strata
+    - tol: Convergence tolerance on the largest marginal residual
+    - return_trace: If True, also return the per-sweep residual trace
+    - inplace: If True, add the column to sample_df itself instead of a shallow copy
 
     Returns:
     - Dataframe with a new column "Rake_Weights" containing the calculated weights.
+      If return_trace is True, a tuple (DataFrame, trace) is returned instead.
     """
-    weights = pd.Series(np.ones(len(sample_df)), index=sample_df.index)
+    codes, targets = _encode_margins(sample_df, strata, target_marginals)
+    weights, trace = _ipf(codes, targets, max_iter=max_iter, tol=tol)
 
-    for col, target_dist in zip(strata, target_marginals):
-        for _ in range(max_iter):
-            # Current weighted marginal
-            sample_dist = weights.groupby(sample_df[col]).sum() / weights.sum()
-
-            # Adjustment factors
-            adjustment = target_dist / sample_dist
-            adjustment = adjustment.replace([np.inf, -np.inf], 0).fillna(0)
-            missing_categories = target_dist.index.difference(sample_df[col].unique())
+    out = prepare_output(sample_df, inplace)
+    out["Rake_Weights"] = weights
+    if return_trace:
+        return out, trace
+    return out
+
+
+def calibrate_weights(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata: list, distance: str = "linear", bounds: tuple = None, max_iter: int = 50, tol: float = 1e-6, return_trace: bool = False, inplace: bool = False) -> pd.DataFrame:
+    """
+    Calibrates sample_df to the unweighted marginal distributions in target_df.
+
+    Parameters:
+    - sample_df: DataFrame to reweight
+    - target_df: Target population DataFrame (unweighted)
+    - strata: List of column names to calibrate on
+    - distance: 'linear' (GREG), 'raking' (raking ratio) or 'logit' (bounded)
+    - bounds: Optional, (lower, upper) bounds on the weights (every row starts at 1).
+      Required for 'logit', truncates the weights for the other distances.
+    - max_iter: Max Newton iterations
+    - tol: Convergence tolerance on the largest marginal residual
+    - return_trace: If True, also return the per-iteration residual trace
+    - inplace: If True, add the column to sample_df itself instead of a shallow copy
+
+    Returns:
+    - Dataframe with a new column "Calib_Weights" containing the calculated weights.
+      If return_trace is True, a tuple (DataFrame, trace) is returned instead.
+    """
+    target_marginals = [
+        target_df[col].value_counts(normalize=True) for col in strata
+    ]
+
+    return _calibrate(sample_df, strata, target_marginals, distance, bounds, max_iter=max_iter, tol=tol, return_trace=return_trace, inplace=inplace)
+
+def calibrate_weights_weighted(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata: list, weight_col: str, distance: str = "linear", bounds: tuple = None, max_iter: int = 50, tol: float = 1e-6, return_trace: bool = False, inplace: bool = False) -> pd.DataFrame:
+    """
+    Calibrates sample_df to weighted marginal distributions derived from aggregated census data.
+
+    Parameters:
+    - sample_df: DataFrame to reweight
+    - target_df: Target population DataFrame with one row per unique combination of variables
+    - strata: List of column names to calibrate on
+    - weight_col: Column in target_df with counts for each combination
+    - distance: 'linear' (GREG), 'raking' (raking ratio) or 'logit' (bounded)
+    - bounds: Optional, (lower, upper) bounds on the weights (every row starts at 1).
+      Required for 'logit', truncates the weights for the other distances.
+    - max_iter: Max Newton iterations
+    - tol: Convergence tolerance on the largest marginal residual
+    - return_trace: If True, also return the per-iteration residual trace
+    - inplace: If True, add the column to sample_df itself instead of a shallow copy
+
+    Returns:
+    - Dataframe with a new column "Calib_Weights" containing the calculated weights.
+      If return_trace is True, a tuple (DataFrame, trace) is returned instead.
+    """
+    target_marginals = [
+        target_df.groupby(col)[weight_col].sum() / target_df[weight_col].sum()
+        for col in strata
+    ]
+
+    return _calibrate(sample_df, strata, target_marginals, distance, bounds, max_iter=max_iter, tol=tol, return_trace=return_trace, inplace=inplace)
+
+
+def _calibrate(sample_df: pd.DataFrame, strata: list, target_marginals: list, distance: str, bounds: tuple, max_iter: int, tol: float, return_trace: bool = False, inplace: bool = False) -> pd.DataFrame:
+    """
+    Shared calibration logic (Deville-Saerndal calibration estimators).
+
+    The strata are turned into one sparse indicator matrix X (one column per
+    category) and the weights w = F(X @ lam) are found with Newton steps on the
+    k x k system X' diag(F') X, where k is the total number of categories. Each
+    step is halved until the convex dual objective sum(G(X @ lam)) - lam' t
+    (G the integral of F, t the totals) decreases, and rows truncated at a
+    bound keep a small slope, so bounded problems don't stall.
+
+    Parameters:
+    - sample_df: DataFrame to reweight
+    - strata: Columns to calibrate on
+    - target_marginals: List of Series of target proportions (one per column)
+    - distance: 'linear', 'raking' or 'logit'
+    - bounds: Optional, (lower, upper) bounds on the weight ratios
+    - max_iter: Max Newton iterations
+    - tol: Convergence tolerance on the largest marginal residual
+    - return_trace: If True, also return the per-iteration residual trace
+    - inplace: If True, add the column to sample_df itself instead of a shallow copy
+
+    Returns:
+    - Dataframe with a new column "Calib_Weights" containing the calculated weights.
+      If return_trace is True, a tuple (DataFrame, trace) is returned instead.
+    """
+    if distance not in {"linear", "raking", "logit"}:
+        raise ValueError("Distance must be 'linear', 'raking' or 'logit'.")
+    if distance == "logit" and bounds is None:
+        raise ValueError("The logit distance requires bounds=(lower, upper).")
+    if bounds is not None and not bounds[0] < 1 < bounds[1]:
+        raise ValueError("Bounds must satisfy lower < 1 < upper.")
+
+    codes, targets = _encode_margins(sample_df, strata, target_marginals)
+    design, base_weights, totals = _calibration_design(codes, targets)
+    calibration = _CALIBRATION_DISTANCES[distance]
+    lower, upper = bounds if bounds is not None else (-np.inf, np.inf)
+
+    def evaluate(lam):
+        ratio, slope, integral = calibration(design @ lam, lower, upper)
+        weights = base_weights * ratio
+        # Dual objective, convex in lam, whose gradient is the margin gap
+        objective = base_weights @ integral - lam @ totals
+        return weights, slope, design.T @ weights - totals, objective
+
+    lam = np.zeros(design.shape[1])
+    weights, slope, gap, objective = evaluate(lam)
+    residuals = []
+    for _ in range(max_iter):
+        residuals.append(float(np.abs(gap).max(initial=0.0)) / max(base_weights.sum(), 1))
+        if residuals[-1] < tol:
+            break
+
+        hessian = (design.T.multiply(base_weights * slope) @ design).toarray()
+        step = np.linalg.lstsq(hessian, gap, rcond=None)[0]
+        # Halve the Newton step until the dual objective decreases enough. With
+        # rows at a bound the full step can overshoot into the flat region.
+        decrease = 1e-4 * float(gap @ step)
+        for _ in range(_CALIBRATION_HALVINGS):
+            candidate_lam = lam - step
+            candidate = evaluate(candidate_lam)
+            if candidate[3] <= objective - decrease:
+                break
+            step, decrease = step / 2, decrease / 2
+        lam = candidate_lam
+        weights, slope, gap, objective = candidate
+
+    trace = pd.DataFrame({"Iteration": np.arange(1, len(residuals) + 1), "Max_Residual": residuals})
+    if residuals and residuals[-1] >= tol:
+        warnings.warn(f"Calibration did not converge after {len(residuals)} iterations (max residual {residuals[-1]:.3g}).")
+
+    out = prepare_output(sample_df, inplace)
+    out["Calib_Weights"] = weights
+    if return_trace:
+        return out, trace
+    return out
+
+
+def _calibration_design(codes: list, targets: list) -> tuple:
+    """
+    Builds the sparse indicator design matrix and calibration totals.
+
+    Rows in a category the target doesn't have get a base weight of 0, as with
+    raking. Totals are scaled so the calibrated weights keep a mean of about 1.
+
+    Returns:
+    - Tuple (design, base_weights, totals): CSR matrix (n x k), ndarray, ndarray
+    """
+    n = len(codes[0]) if codes else 0
+    base_weights = np.ones(n)
+    for col_codes, target in zip(codes, targets):
+        base_weights[np.isin(col_codes, np.flatnonzero(target[:-1] == 0))] = 0.0
+
+    rows, cols, totals = [], [], []
+    offset = 0
+    for col_codes, target in zip(codes, targets):
+        observed = col_codes < len(target) - 1
+        rows.append(np.flatnonzero(observed))
+        cols.append(col_codes[observed] + offset)
+        # Rows with a missing value are left out of this margin
+        totals.append(target[:-1] * base_weights[observed].sum())
+        offset += len(target) - 1
+
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.intp)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.intp)
+    design = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, offset))
+    return design, base_weights, np.concatenate(totals) if totals else np.zeros(0)
+
+
+def _linear_distance(u: np.ndarray, lower: float, upper: float) -> tuple:
+    """
+    Linear (chi-square) distance, truncated at the bounds. Returns (F(u), F'(u), integral of F from 0 to u).
+    """
+    ratio = np.clip(1 + u, lower, upper)
+    inside = (1 + u > lower) & (1 + u < upper)
+    clipped = ratio - 1
+    integral = clipped + clipped ** 2 / 2 + ratio * (u - clipped)
+    return ratio, np.where(inside, 1.0, _BOUND_SLOPE), integral
+
+
+def _raking_distance(u: np.ndarray, lower: float, upper: float) -> tuple:
+    """
+    Raking-ratio (multiplicative) distance, truncated at the bounds. Returns (F(u), F'(u), integral of F from 0 to u).
+    """
+    log_lower = np.log(lower) if lower > 0 else -np.inf
+    log_upper = np.log(upper)
+    clipped = np.clip(u, log_lower, min(log_upper, 700))
+    ratio = np.exp(clipped)
+    inside = (u > log_lower) & (u < log_upper)
+    integral = ratio - 1 + ratio * (u - clipped)
+    return ratio, np.where(inside, ratio, _BOUND_SLOPE * ratio), integral
+
+
+def _logit_distance(u: np.ndarray, lower: float, upper: float) -> tuple:
+    """
+    Logit distance, which keeps the weight ratios strictly inside the bounds. Returns (F(u), F'(u), integral of F from 0 to u).
+    """
+    a = (upper - lower) / ((1 - lower) * (upper - 1))
+    e = np.exp(np.clip(a * u, -700, 700))
+    denominator = (upper - 1) + (1 - lower) * e
+    ratio = (lower * (upper - 1) + upper * (1 - lower) * e) / denominator
+    # Written as (e / d) * (1 / d) so large e doesn't overflow d ** 2
+    slope = a * (1 - lower) * (upper - 1) * (upper - lower) * (e / denominator) / denominator
+    log_denominator = np.logaddexp(np.log(upper - 1), np.log(1 - lower) + a * u)
+    integral = lower * u + (upper - lower) / a * (log_denominator - np.log(upper - lower))
+    return ratio, slope, integral
+
+
+# Slope given to rows truncated at a bound, so the Newton system stays non-singular
+_BOUND_SLOPE = 1e-3
+# Maximum number of step halvings per Newton iteration
+_CALIBRATION_HALVINGS = 30
+
+_CALIBRATION_DISTANCES = {
+    "linear": _linear_distance,
+    "raking": _raking_distance,
+    "logit": _logit_distance,
+}
+
+
+def rake_weights_streaming(
+    sample,
+    target_df: pd.DataFrame,
+    strata: list,
+    output_path: str,
+    weight_col: str = None,
+    chunksize: int = 100_000,
+    max_iter: int = 20,
+    tol: float = 1e-6,
+    work_dir: str = None
+) -> tuple:
+    """
+    Out-of-core variant of rake_weights / rake_weights_weighted.
+
+    The sample is read chunk by chunk and only the integer-coded strata are kept,
+    in memory-mapped files. Every sweep accumulates the marginal sums block by
+    block, so peak memory is bounded by chunksize rather than by sample size.
+
+    Parameters:
+    - sample: Path to a CSV file or an iterable of DataFrame chunks
+    - target_df: Target population DataFrame
+    - strata: List of column names to rake on (in order)
+    - output_path: .npy file the weights are written to (one value per sample row)
+    - weight_col: Optional, column in target_df with counts for each combination
+    - chunksize: Rows per chunk when reading the CSV and per block during sweeps
+    - max_iter: Max number of sweeps over all strata
+    - tol: Convergence tolerance on the largest marginal residual
+    - work_dir: Optional, directory for the temporary code files
+
+    Returns:
+    - Tuple (weights, trace): read-only memmap of the weights stored in
+      output_path and a DataFrame with the per-sweep residual trace.
+    """
+    if isinstance(sample, (str, os.PathLike)):
+        chunks = pd.read_csv(sample, usecols=strata, chunksize=chunksize)
+    else:
+        chunks = sample
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        code_paths = [os.path.join(tmp, f"strata_{i}.codes") for i in range(len(strata))]
+        categories, n = _spool_codes(chunks, strata, code_paths)
+
+        marginal_cache = {}
+        codes, targets = [], []
+        for col, path, col_categories in zip(strata, code_paths, categories):
+            target_dist = _cached_marginal(target_df, col, weight_col, marginal_cache)
+            missing_categories = target_dist.index.difference(col_categories)
             if not missing_categories.empty:
                 warnings.warn(f"Missing categories in sample for column '{col}': {missing_categories.tolist()}")
+            target = target_dist.reindex(col_categories).fillna(0).to_numpy(dtype=float)
+            codes.append(np.memmap(path, dtype=np.int32, mode="r", shape=(n,)) if n else np.zeros(0, dtype=np.int32))
+            targets.append(np.append(target, np.nan))
+
+        weights = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.float64, shape=(n,))
+        weights[:] = 1.0
+        trace = _ipf_blocked(codes, targets, weights, chunksize, max_iter=max_iter, tol=tol)
+        weights.flush()
+        del weights, codes
+
+    return np.load(output_path, mmap_mode="r"), trace
+
+
+def _spool_codes(chunks, strata: list, code_paths: list) -> tuple:
+    """
+    Factorizes the strata of each chunk against growing category lists and
+    appends the int32 codes (-1 for missing values) to one file per column.
+
+    Returns:
+    - Tuple (categories, n_rows)
+    """
+    categories = [pd.Index([]) for _ in strata]
+    n = 0
+    files = [open(path, "wb") for path in code_paths]
+    try:
+        for chunk in chunks:
+            for i, col in enumerate(strata):
+                values = chunk[col]
+                codes = categories[i].get_indexer(values)
+                unseen = (codes < 0) & values.notna().to_numpy()
+                if unseen.any():
+                    categories[i] = categories[i].append(pd.Index(pd.unique(values[unseen])))
+                    codes = categories[i].get_indexer(values)
+                    codes[values.isna().to_numpy()] = -1
+                files[i].write(codes.astype(np.int32).tobytes())
+            n += len(chunk)
+    finally:
+        for f in files:
+            f.close()
+    return categories, n
+
+
+def _ipf_blocked(codes: list, targets: list, weights: np.ndarray, blocksize: int, max_iter: int, tol: float) -> pd.DataFrame:
+    """
+    Same iteration as _ipf, but reads codes and updates weights block by block
+    so both can live in memory-mapped files. Codes use -1 for missing values.
+
+    Returns:
+    - DataFrame with one row per sweep holding the largest marginal residual
+    """
+    n = len(weights)
+    blocks = [slice(start, min(start + blocksize, n)) for start in range(0, n, blocksize)]
+    residuals = []
+    cap = np.inf
+
+    def block_codes(col_codes, block, n_slots):
+        c = np.asarray(col_codes[block], dtype=np.intp)
+        return np.where(c < 0, n_slots - 1, c)
 
-            new_weights = weights * sample_df[col].map(adjustment).fillna(1)
-            new_weights = new_weights.clip(upper=10 * new_weights.mean())
+    def margin_sums(margins):
+        # Applies the pending cap while accumulating, so each pass reads the weights once
+        sums = [np.zeros(len(target)) for _, target in margins]
+        for block in blocks:
+            w = np.minimum(weights[block], cap)
+            weights[block] = w
+            for s, (col_codes, target) in zip(sums, margins):
+                s += np.bincount(block_codes(col_codes, block, len(target)), weights=w, minlength=len(target))
+        return sums
 
-            if np.max(np.abs(new_weights - weights)) < tol:
+    for _ in range(max_iter):
+        for col_codes, target in zip(codes, targets):
+            sums = margin_sums([(col_codes, target)])[0]
+            total = sums[:-1].sum()
+            factors = np.divide(target * total, sums, out=np.zeros_like(sums), where=sums > 0)
+            factors[-1] = 1.0
+
+            new_total = 0.0
+            for block in blocks:
+                w = weights[block] * factors[block_codes(col_codes, block, len(target))]
+                weights[block] = w
+                new_total += w.sum()
+            cap = 10 * new_total / n
+
+        residual = 0.0
+        for sums, (_, target) in zip(margin_sums(list(zip(codes, targets))), zip(codes, targets)):
+            margin_total = sums[:-1].sum()
+            if margin_total <= 0:
+                residual = np.inf
                 break
+            residual = max(residual, float(np.abs(sums[:-1] / margin_total - target[:-1]).max(initial=0.0)))
+        cap = np.inf
+        residuals.append(residual)
+        if residual < tol:
+            break
+
+    trace = pd.DataFrame({"Sweep": np.arange(1, len(residuals) + 1), "Max_Residual": residuals})
+    if residuals and residuals[-1] >= tol:
+        warnings.warn(f"Raking did not converge after {len(residuals)} sweeps (max residual {residuals[-1]:.3g}).")
+    return trace
+
+
+def _factorize(values: pd.Series) -> tuple:
+    """
+    Encodes a stratum column as integer codes.
+
+    Missing values get their own code one past the last category, so the codes
+    can be fed straight into np.bincount.
+
+    Parameters:
+    - values: Column to encode
+
+    Returns:
+    - Tuple (codes, categories) with codes in [0, len(categories)]
+    """
+    codes, categories = pd.factorize(values, sort=False)
+    codes = np.where(codes < 0, len(categories), codes).astype(np.intp, copy=False)
+    return codes, pd.Index(categories)
+
+
+def _encode_margins(sample_df: pd.DataFrame, strata: list, target_marginals: list, factorized: dict = None) -> tuple:
+    """
+    Aligns target marginals with the integer codes of each stratum.
+
+    Parameters:
+    - sample_df: DataFrame to reweight
+    - strata: Columns to rake on (in order)
+    - target_marginals: List of Series of target proportions (one per column)
+    - factorized: Optional, dict of column -> (codes, categories) to reuse
+
+    Returns:
+    - Tuple (codes, targets): lists of code arrays and target proportion arrays.
+      Each target array has a trailing NaN slot for missing stratum values.
+    """
+    codes, targets = [], []
+    for col, target_dist in zip(strata, target_marginals):
+        if factorized is not None and col in factorized:
+            col_codes, categories = factorized[col]
+        else:
+            col_codes, categories = _factorize(sample_df[col])
+
+        missing_categories = target_dist.index.difference(categories)
+        if not missing_categories.empty:
+            warnings.warn(f"Missing categories in sample for column '{col}': {missing_categories.tolist()}")
 
-            weights = new_weights
-    sample_df["Rake_Weights"] = weights
-    return sample_df
+        target = target_dist.reindex(categories).fillna(0).to_numpy(dtype=float)
+        codes.append(col_codes)
+        targets.append(np.append(target, np.nan))
+    return codes, targets
+
+
+def _ipf(codes: list, targets: list, max_iter:int, tol:float, base_weights: np.ndarray = None) -> tuple:
+    """
+    Iterative proportional fitting over integer-coded strata.
+
+    Each sweep adjusts every margin in turn using np.bincount marginal sums, then
+    measures the largest absolute gap between weighted and target proportions
+    across all margins.
+
+    Parameters:
+    - codes: List of integer code arrays (one per stratum)
+    - targets: List of target proportion arrays aligned with the codes
+    - max_iter: Max number of sweeps over all strata
+    - tol: Convergence tolerance on the largest marginal residual
+    - base_weights: Optional, starting weights (defaults to ones)
+
+    Returns:
+    - Tuple (weights, trace): ndarray of weights and a DataFrame with one row per
+      sweep holding the largest marginal residual.
+    """
+    n = len(codes[0]) if codes else 0
+    weights = np.ones(n) if base_weights is None else np.array(base_weights, dtype=float)
+    residuals = []
+
+    for _ in range(max_iter):
+        for col_codes, target in zip(codes, targets):
+            sums = np.bincount(col_codes, weights=weights, minlength=len(target))
+            total = sums[:-1].sum()
+            # Categories without target mass get a factor of 0, missing values keep theirs
+            factors = np.divide(target * total, sums, out=np.zeros_like(sums), where=sums > 0)
+            factors[-1] = 1.0
+            weights = weights * factors[col_codes]
+            weights = np.minimum(weights, 10 * weights.mean())
+
+        residuals.append(_margin_residual(codes, targets, weights))
+        if residuals[-1] < tol:
+            break
+
+    trace = pd.DataFrame({"Sweep": np.arange(1, len(residuals) + 1), "Max_Residual": residuals})
+    if residuals and residuals[-1] >= tol:
+        warnings.warn(f"Raking did not converge after {len(residuals)} sweeps (max residual {residuals[-1]:.3g}).")
+    return weights, trace
+
+
+def _margin_residual(codes: list, targets: list, weights: np.ndarray) -> float:
+    """
+    Largest absolute difference between weighted and target proportions over all margins.
+    Rows with a missing stratum value are left out of that stratum's proportions.
+    """
+    residual = 0.0
+    for col_codes, target in zip(codes, targets):
+        sums = np.bincount(col_codes, weights=weights, minlength=len(target))[:-1]
+        total = sums.sum()
+        if total <= 0:
+            return np.inf
+        residual = max(residual, float(np.abs(sums / total - target[:-1]).max()))
+    return residual
 
 
 def poststratify_weights(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata: list) -> pd.Series:
@@ -95,8 +568,7 @@ def poststratify_weights(sample_df: pd.DataFrame, target_df: pd.DataFrame, strat
     Returns:
     - Series of weights indexed like sample_df
     """
-    target_dist = target_df.groupby(strata).size() / len(target_df)
-    return _poststratify(sample_df, strata, target_dist)
+    return _poststratify_cells(sample_df, strata, target_df[strata], np.ones(len(target_df)))
 
 def poststratify_weights_weighted(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata: list, weight_col: str) -> pd.Series: 
     """
@@ -109,31 +581,155 @@ def poststratify_weights_weighted(sample_df: pd.DataFrame, target_df: pd.DataFra
     Returns:
     - Series of weights indexed like sample_df
     """
-    target_dist = target_df.groupby(strata)[weight_col].sum() / target_df[weight_col].sum()
-    return _poststratify(sample_df, strata, target_dist)
+    return _poststratify_cells(sample_df, strata, target_df[strata], target_df[weight_col].to_numpy(dtype=float))
 
-def _poststratify(sample_df: pd.DataFrame, strata: list, target_dist: pd.Series) -> pd.Series:
+def _poststratify_cells(sample_df: pd.DataFrame, strata: list, target_cells: pd.DataFrame, target_mass: np.ndarray, factorized: dict = None) -> pd.Series:
     """
-    Shared post-stratification logic. Matches sample_df marginals to the given target distribution.
+    Post-stratification on composite integer cell keys.
+
     Parameters:
     - sample_df: DataFrame to reweight
     - strata: strata to post-stratify on (in order)
-    - target_dist: Series of target proportions indexed by the unique combinations of the strata
+    - target_cells: DataFrame with the strata columns of the target table
+    - target_mass: Count or proportion for each row of target_cells
+    - factorized: Optional, dict of column -> (codes, categories) to reuse
     Returns:
     - Series of weights indexed like sample_df
     """
-    sample_dist = sample_df.groupby(strata).size() / len(sample_df)
+    row_cells, target_dist, n_union = _poststrat_cells(sample_df, strata, target_cells, target_mass, factorized)
+    return pd.Series(_poststrat_factors(row_cells, target_dist, n_union), index=sample_df.index)
 
-    weight_factors = target_dist / sample_dist
-    weight_factors = weight_factors.replace([np.inf, -np.inf], 0).fillna(0)
-    max_weight = 10 * weight_factors.mean()
-    weight_factors = weight_factors.clip(upper=max_weight)
-    missing_strata = target_dist.index.difference(sample_dist.index)
-    if not missing_strata.empty:
-        warnings.warn(f"Missing strata in sample: {missing_strata.tolist()}")
+def _poststrat_cells(sample_df: pd.DataFrame, strata: list, target_cells: pd.DataFrame, target_mass: np.ndarray, factorized: dict = None) -> tuple:
+    """
+    Assigns sample rows and target mass to composite integer cell keys.
+
+    The strata of both frames are packed into one integer key per row, so cell
+    counts come from np.bincount over the cells that actually occur instead of
+    over the full cross product. target_cells may repeat cells (e.g. raw census
+    rows); their mass is summed.
 
-    sample_df_key = pd.MultiIndex.from_frame(sample_df[strata])
-    return pd.Series(sample_df_key.map(weight_factors.values), index=sample_df.index)
+    Parameters:
+    - sample_df: DataFrame to reweight
+    - strata: strata to post-stratify on (in order)
+    - target_cells: DataFrame with the strata columns of the target table
+    - target_mass: Count or proportion for each row of target_cells
+    - factorized: Optional, dict of column -> (codes, categories) to reuse
+    Returns:
+    - Tuple (row_cells, target_dist, n_union): cell id per sample row (-1 for rows
+      with a missing stratum value), target proportion per cell id and the number
+      of cells in sample or target
+    """
+    n_sample = len(sample_df)
+    sample_valid = np.ones(n_sample, dtype=bool)
+    target_valid = np.ones(len(target_cells), dtype=bool)
+    target_seen = np.ones(len(target_cells), dtype=bool)
+    sample_codes, target_codes, radices = [], [], []
+
+    for col in strata:
+        if factorized is not None and col in factorized:
+            codes, categories = factorized[col]
+        else:
+            codes, categories = _factorize(sample_df[col])
+        t_codes = _lookup_codes(target_cells[col], categories)
+
+        # Rows with a missing stratum value are left out, like groupby(dropna=True)
+        sample_valid &= codes < len(categories)
+        target_valid &= t_codes < len(categories)
+        target_seen &= t_codes >= 0
+        sample_codes.append(codes)
+        target_codes.append(t_codes)
+        radices.append(max(len(categories), 1))
+
+    target_used = target_valid & target_seen
+    keys = _composite_key(
+        [np.concatenate([s[sample_valid], t[target_used]]) for s, t in zip(sample_codes, target_codes)],
+        radices
+    )
+    cell_ids, cells = pd.factorize(keys)
+    n_cells = len(cells)
+    n_valid = sample_valid.sum()
+    target_ids = cell_ids[n_valid:]
+    row_cells = np.full(n_sample, -1, dtype=np.intp)
+    row_cells[sample_valid] = cell_ids[:n_valid]
+    target_dist = np.bincount(target_ids, weights=target_mass[target_used], minlength=n_cells) / target_mass.sum()
+
+    # Target cells with a category the sample never has can't be weighted
+    unseen = target_cells[target_valid & ~target_seen]
+    n_union = n_cells + len(unseen.drop_duplicates())
+
+    empty_cells = np.flatnonzero(np.bincount(cell_ids[:n_valid], minlength=n_cells) == 0)
+    missing = pd.concat([unseen, target_cells[target_used].iloc[np.flatnonzero(np.isin(target_ids, empty_cells))]])
+    if not missing.empty:
+        missing_strata = list(missing.drop_duplicates().itertuples(index=False, name=None))
+        shown = missing_strata[:10]
+        more = f" (and {len(missing_strata) - len(shown)} more)" if len(missing_strata) > len(shown) else ""
+        warnings.warn(f"Missing strata in sample: {shown}{more}")
+
+    return row_cells, target_dist, n_union
+
+def _poststrat_factors(row_cells: np.ndarray, target_dist: np.ndarray, n_union: int, base_weights: np.ndarray = None) -> np.ndarray:
+    """
+    Post-stratification weights from precomputed cell ids.
+
+    Parameters:
+    - row_cells: Cell id per sample row, -1 for rows with a missing stratum value
+    - target_dist: Target proportion per cell id
+    - n_union: Number of cells in sample or target, used for the weight cap
+    - base_weights: Optional, design weights the sample shares are computed with
+    Returns:
+    - ndarray of weights (NaN for rows with a missing stratum value)
+    """
+    valid = row_cells >= 0
+    base = np.ones(len(row_cells)) if base_weights is None else base_weights
+    sample_dist = np.bincount(row_cells[valid], weights=base[valid], minlength=len(target_dist)) / base.sum()
+
+    weight_factors = np.divide(target_dist, sample_dist, out=np.zeros(len(target_dist)), where=sample_dist > 0)
+    max_weight = 10 * weight_factors.sum() / max(n_union, 1)
+    weight_factors = np.minimum(weight_factors, max_weight)
+
+    weights = np.full(len(row_cells), np.nan)
+    weights[valid] = base[valid] * weight_factors[row_cells[valid]]
+    return weights
+
+def _lookup_codes(values: pd.Series, categories: pd.Index) -> np.ndarray:
+    """
+    Encodes values against the categories of an already factorized column.
+
+    Parameters:
+    - values: Column to encode
+    - categories: Categories returned by _factorize
+    Returns:
+    - ndarray of codes; missing values get len(categories), unknown values -1
+    """
+    codes = categories.get_indexer(values)
+    codes[pd.isna(values).to_numpy()] = len(categories)
+    return codes.astype(np.intp, copy=False)
+
+def _composite_key(codes: list, radices: list) -> np.ndarray:
+    """
+    Packs several code arrays into a single int64 key per row (mixed radix).
+
+    When the product of the radices no longer fits into int64, the key built so
+    far is re-densified with pd.factorize, which bounds it by the number of
+    distinct combinations seen instead of the size of the cross product.
+
+    Parameters:
+    - codes: List of code arrays, each in [0, radix)
+    - radices: Number of categories per code array
+    Returns:
+    - ndarray of int64 keys; equal keys mean equal combinations
+    """
+    n = len(codes[0]) if codes else 0
+    key = np.zeros(n, dtype=np.int64)
+    span = 1
+    for col_codes, radix in zip(codes, radices):
+        if span * radix >= _MAX_KEY_SPAN:
+            key, uniques = pd.factorize(key)
+            key = key.astype(np.int64, copy=False)
+            span = max(len(uniques), 1)
+        key = key * radix + col_codes
+        span *= radix
+    return key
 
 def apply_weights(
     sample_df: pd.DataFrame,
@@ -142,7 +738,9 @@ def apply_weights(
     method: str = "rake",
     weight_col: str = None,
     max_iter: int = 20,
-    tol: float = 1e-6
+    tol: float = 1e-6,
+    return_trace: bool = False,
+    inplace: bool = False
 ) -> pd.DataFrame:
     """
     Applies raking or post-stratification weights to a sample DataFrame.
@@ -153,35 +751,257 @@ def apply_weights(
     - strata: List of column names to weight on
     - method: 'rake' or 'poststrat'
     - weight_col: Optional, column in target_df with counts (required for weighted targets)
-    - max_iter: Max iterations (only relevant for raking)
+    - max_iter: Max sweeps over all strata (only relevant for raking)
     - tol: Convergence tolerance (only relevant for raking)
+    - return_trace: If True, also return the per-sweep residual trace (only relevant for raking)
+    - inplace: If True, add the column to sample_df itself instead of a shallow copy
 
     Returns:
     - sample_df with an added column 'Rake_Weights' or 'Poststrat_Weights'
     """
-    # Validate method
-    if method not in {"rake", "poststrat"}:
-        raise ValueError("Method must be 'rake' or 'poststrat'.")
-
-    # Validate strata exist in both dataframes
-    missing_sample_cols = set(strata) - set(sample_df.strata)
-    missing_target_cols = set(strata) - set(target_df.strata)
-
-    if missing_sample_cols:
-        raise ValueError(f"Missing strata in sample_df: {missing_sample_cols}")
-    if missing_target_cols:
-        raise ValueError(f"Missing strata in target_df: {missing_target_cols}")
+    _validate_scheme(sample_df, target_df, strata, method)
 
     # Apply the appropriate method
     if method == "rake":
         if weight_col:
-            return rake_weights_weighted(sample_df, target_df, strata, weight_col, max_iter, tol)
+            return rake_weights_weighted(sample_df, target_df, strata, weight_col, max_iter, tol, return_trace, inplace)
         else:
-            return rake_weights(sample_df, target_df, strata, max_iter, tol)
+            return rake_weights(sample_df, target_df, strata, max_iter, tol, return_trace, inplace)
     else:  # method == "poststrat"
         if weight_col:
             weights = poststratify_weights_weighted(sample_df, target_df, strata, weight_col)
         else:
             weights = poststratify_weights(sample_df, target_df, strata)
-        sample_df["Poststrat_Weights"] = weights
-        return sample_df
\ No newline at end of file
+        out = prepare_output(sample_df, inplace)
+        out["Poststrat_Weights"] = weights
+        return out
+
+
+def apply_weights_batch(
+    sample_df: pd.DataFrame,
+    schemes: list,
+    max_iter: int = 20,
+    tol: float = 1e-6
+) -> pd.DataFrame:
+    """
+    Computes several raking / post-stratification weight variants in one pass.
+
+    Every stratum column of sample_df is factorized once and target marginals
+    are computed once per (target_df, weight_col, column), then shared by all
+    schemes that use them.
+
+    Parameters:
+    - sample_df: DataFrame to reweight
+    - schemes: List of dicts, one per weight variant, with keys
+        - 'target_df': Target population DataFrame
+        - 'strata': List of column names to weight on
+        - 'method': Optional, 'rake' (default) or 'poststrat'
+        - 'weight_col': Optional, column in target_df with counts
+        - 'name': Optional, name of the output column
+        - 'max_iter', 'tol': Optional, per-scheme raking settings
+    - max_iter: Default max sweeps over all strata (only relevant for raking)
+    - tol: Default convergence tolerance (only relevant for raking)
+
+    Returns:
+    - DataFrame indexed like sample_df with one weight column per scheme
+    """
+    factorized = {}
+    marginal_cache = {}
+    weights = {}
+
+    for i, scheme in enumerate(schemes):
+        target_df = scheme["target_df"]
+        strata = scheme["strata"]
+        method = scheme.get("method", "rake")
+        weight_col = scheme.get("weight_col")
+        name = scheme.get("name", f"{'Rake' if method == 'rake' else 'Poststrat'}_Weights_{i}")
+
+        _validate_scheme(sample_df, target_df, strata, method)
+        if name in weights:
+            raise ValueError(f"Duplicate weight column name: '{name}'")
+
+        for col in strata:
+            if col not in factorized:
+                factorized[col] = _factorize(sample_df[col])
+
+        if method == "rake":
+            target_marginals = [
+                _cached_marginal(target_df, col, weight_col, marginal_cache) for col in strata
+            ]
+            codes, targets = _encode_margins(sample_df, strata, target_marginals, factorized)
+            weights[name], _ = _ipf(
+                codes, targets,
+                max_iter=scheme.get("max_iter", max_iter),
+                tol=scheme.get("tol", tol)
+            )
+        else:  # method == "poststrat"
+            target_mass = target_df[weight_col].to_numpy(dtype=float) if weight_col else np.ones(len(target_df))
+            weights[name] = _poststratify_cells(sample_df, strata, target_df[strata], target_mass, factorized).to_numpy()
+
+    return pd.DataFrame(weights, index=sample_df.index)
+
+
+def replicate_weights(
+    sample_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    strata: list,
+    method: str = "rake",
+    weight_col: str = None,
+    replicate_type: str = "bootstrap",
+    n_replicates: int = 200,
+    group_col: str = None,
+    max_iter: int = 20,
+    tol: float = 1e-6,
+    n_jobs: int = None,
+    random_state: int = 0
+) -> np.ndarray:
+    """
+    Computes replicate weights for design-based variance estimation.
+
+    Each replicate perturbs the sample with bootstrap or delete-one-group
+    jackknife multipliers and reruns the weighting method with those multipliers
+    as base weights. Replicates run in a process pool; the stratum codes are
+    written once to a memory-mapped file that all workers share read-only.
+
+    Parameters:
+    - sample_df: DataFrame to reweight
+    - target_df: Target population DataFrame
+    - strata: List of column names to weight on
+    - method: 'rake' or 'poststrat'
+    - weight_col: Optional, column in target_df with counts (required for weighted targets)
+    - replicate_type: 'bootstrap' (Rao-Wu, n-1 units drawn with replacement) or 'jackknife'
+    - n_replicates: Number of bootstrap replicates, or of random jackknife groups
+      when group_col is not given
+    - group_col: Optional, column in sample_df with resampling units (e.g. PSUs).
+      If None, every row is its own unit.
+    - max_iter: Max sweeps over all strata (only relevant for raking)
+    - tol: Convergence tolerance (only relevant for raking)
+    - n_jobs: Number of worker processes. None uses all cores, 1 runs in-process.
+    - random_state: Seed for reproducibility
+
+    Returns:
+    - float32 array of shape (len(sample_df), n_replicates) with one replicate weight column per replicate
+    """
+    _validate_scheme(sample_df, target_df, strata, method)
+    if replicate_type not in {"bootstrap", "jackknife"}:
+        raise ValueError("Replicate type must be 'bootstrap' or 'jackknife'.")
+
+    rng = np.random.default_rng(random_state)
+    if group_col is not None:
+        units, _ = pd.factorize(sample_df[group_col])
+        if (units < 0).any():
+            raise ValueError(f"Missing values in group column '{group_col}'")
+    elif replicate_type == "jackknife":
+        units = rng.permutation(len(sample_df)) % n_replicates
+    else:
+        units = np.arange(len(sample_df))
+    n_units = units.max(initial=-1) + 1
+    if n_units < 2:
+        raise ValueError("At least two resampling units are needed for replicate weights.")
+    if replicate_type == "jackknife":
+        n_replicates = n_units
+
+    if method == "rake":
+        target_marginals = [_cached_marginal(target_df, col, weight_col, {}) for col in strata]
+        codes, targets = _encode_margins(sample_df, strata, target_marginals)
+        spec = {"method": "rake", "targets": targets, "max_iter": max_iter, "tol": tol}
+    else:  # method == "poststrat"
+        target_mass = target_df[weight_col].to_numpy(dtype=float) if weight_col else np.ones(len(target_df))
+        row_cells, target_dist, n_union = _poststrat_cells(sample_df, strata, target_df[strata], target_mass)
+        codes = [row_cells]
+        spec = {"method": "poststrat", "target_dist": target_dist, "n_union": n_union}
+    spec.update({"replicate_type": replicate_type, "n_units": n_units})
+
+    seeds = np.random.SeedSequence(random_state).spawn(n_replicates)
+    tasks = list(enumerate(seeds))
+    result = np.empty((len(sample_df), n_replicates), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        codes_path = os.path.join(tmp, "codes.npy")
+        np.save(codes_path, np.column_stack(codes + [units]).astype(np.int64))
+
+        if n_jobs == 1:
+            _init_replicate_worker(codes_path, spec)
+            for r, weights in map(_replicate_task, tasks):
+                result[:, r] = weights
+        else:
+            chunksize = max(1, n_replicates // (4 * (n_jobs or os.cpu_count() or 1)))
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_replicate_worker, initargs=(codes_path, spec)) as pool:
+                for r, weights in pool.map(_replicate_task, tasks, chunksize=chunksize):
+                    result[:, r] = weights
+    return result
+
+
+_REPLICATE_STATE = {}
+
+
+def _init_replicate_worker(codes_path: str, spec: dict) -> None:
+    """
+    Loads the shared stratum codes (memory-mapped, read-only) into a worker process.
+    """
+    _REPLICATE_STATE["codes"] = np.load(codes_path, mmap_mode="r")
+    _REPLICATE_STATE["spec"] = spec
+
+
+def _replicate_task(task: tuple) -> tuple:
+    """
+    Computes the weights of one replicate inside a worker process.
+
+    Parameters:
+    - task: Tuple (replicate index, SeedSequence)
+    Returns:
+    - Tuple (replicate index, float32 weights)
+    """
+    r, seed = task
+    codes = _REPLICATE_STATE["codes"]
+    spec = _REPLICATE_STATE["spec"]
+    units = np.asarray(codes[:, -1])
+    n_units = spec["n_units"]
+
+    if spec["replicate_type"] == "bootstrap":
+        draws = np.random.default_rng(seed).integers(0, n_units, n_units - 1)
+        unit_multipliers = np.bincount(draws, minlength=n_units) * n_units / (n_units - 1)
+    else:  # jackknife: delete unit r
+        unit_multipliers = np.full(n_units, n_units / (n_units - 1))
+        unit_multipliers[r] = 0.0
+    base_weights = unit_multipliers[units]
+
+    if spec["method"] == "rake":
+        strata_codes = [np.asarray(codes[:, i], dtype=np.intp) for i in range(codes.shape[1] - 1)]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            weights, _ = _ipf(strata_codes, spec["targets"], max_iter=spec["max_iter"], tol=spec["tol"], base_weights=base_weights)
+    else:
+        weights = _poststrat_factors(np.asarray(codes[:, 0], dtype=np.intp), spec["target_dist"], spec["n_union"], base_weights)
+    return r, weights.astype(np.float32)
+
+
+def _cached_marginal(target_df: pd.DataFrame, col: str, weight_col: str, cache: dict) -> pd.Series:
+    """
+    Target proportions of one column, memoized per target frame and weight column.
+    """
+    key = (id(target_df), weight_col, col)
+    if key not in cache:
+        if weight_col:
+            cache[key] = target_df.groupby(col)[weight_col].sum() / target_df[weight_col].sum()
+        else:
+            cache[key] = target_df[col].value_counts(normalize=True)
+    return cache[key]
+
+
+def _validate_scheme(sample_df: pd.DataFrame, target_df: pd.DataFrame, strata: list, method: str) -> None:
+    """
+    Checks the weighting method and that all strata exist in both DataFrames.
+    """
+    # Validate method
+    if method not in {"rake", "poststrat"}:
+        raise ValueError("Method must be 'rake' or 'poststrat'.")
+
+    # Validate strata exist in both dataframes
+    missing_sample_cols = set(strata) - set(sample_df.columns)
+    missing_target_cols = set(strata) - set(target_df.columns)
+
+    if missing_sample_cols:
+        raise ValueError(f"Missing strata in sample_df: {missing_sample_cols}")
+    if missing_target_cols:
+        raise ValueError(f"Missing strata in target_df: {missing_target_cols}")
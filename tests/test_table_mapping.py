@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.processing.table_mapping import apply_value_mapping, compile_value_mapping
+
+
+@pytest.mark.parametrize("as_categorical", [True, False])
+@pytest.mark.parametrize("series", [
+    pd.Series([np.nan, np.nan, None], dtype=object),
+    pd.Series([], dtype=object),
+    pd.Series(pd.Categorical([np.nan, np.nan])),
+    pd.Series(pd.Categorical([])),
+], ids=["all_nan", "empty", "all_nan_categorical", "empty_categorical"])
+def test_apply_without_values(series, as_categorical):
+    values, report = compile_value_mapping({"a": "A"}).apply(series, as_categorical)
+    assert len(values) == len(series)
+    assert values.isna().all()
+    assert report.empty
+
+
+def test_apply_matches_series_map():
+    df = pd.DataFrame({"x": ["a", "b", None, "c", "a"]})
+    out, report = apply_value_mapping(df, {"x": {"a": "A", "b": "B"}}, as_categorical=False, return_report=True)
+    pd.testing.assert_series_equal(out["x"], df["x"].map({"a": "A", "b": "B"}), check_dtype=False)
+    assert report.to_dict("records") == [{"Column": "x", "Value": "c", "Count": 1}]
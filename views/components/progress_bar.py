@@ -0,0 +1,17 @@
+# src/views/components/progress_bar.py
+import streamlit as st
+
+def render_progress_bar(label):
+    """
+    Renders a progress bar plus a status line and returns a callback that
+    updates both, for processing functions that accept a progress_callback
+    (e.g. iterative_impute(method="parallel")).
+    """
+    bar = st.progress(0.0, text=label)
+    status = st.empty()
+
+    def update(current, total, change, seconds):
+        bar.progress(min(current / total, 1.0), text=f"{label} ({current}/{total})")
+        status.caption(f"Round {current}: change {change:.2e}, {seconds:.2f}s")
+
+    return update